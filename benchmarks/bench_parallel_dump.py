@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Measure how `ModelSchema.parallel_dump` scales with the number of worker
+processes, compared to a single process `dump_raw`, on raw documents built in
+memory (no database needed).
+
+Usage: python benchmarks/bench_parallel_dump.py [--docs 200000] [--workers 1 2 4]
+"""
+
+import argparse
+import datetime as dt
+import os
+import time
+
+import bson
+import mongoengine as me
+
+from marshmallow_mongoengine import ModelSchema
+
+
+class Address(me.EmbeddedDocument):
+    city = me.StringField()
+    location = me.PointField()
+
+
+class BenchDoc(me.Document):
+    name = me.StringField()
+    count = me.IntField()
+    ratio = me.FloatField()
+    created = me.DateTimeField()
+    owner = me.ReferenceField("BenchDoc")
+    tags = me.ListField(me.StringField())
+    addresses = me.ListField(me.EmbeddedDocumentField(Address))
+    extra = me.DictField()
+
+
+# Module level to be imported by the worker processes
+class BenchDocSchema(ModelSchema):
+    class Meta:
+        model = BenchDoc
+
+
+def make_raw_documents(docs_count):
+    owner = bson.ObjectId()
+    return [
+        {
+            "_id": bson.ObjectId(),
+            "name": "document %s" % i,
+            "count": i,
+            "ratio": i / 3,
+            "created": dt.datetime(2020, 1, 1) + dt.timedelta(minutes=i),
+            "owner": owner,
+            "tags": ["tag %s" % j for j in range(i % 5)],
+            "addresses": [
+                {
+                    "city": "city %s" % j,
+                    "location": {"type": "Point", "coordinates": [j, i % 90]},
+                }
+                for j in range(i % 3)
+            ],
+            "extra": {"key": i},
+        }
+        for i in range(docs_count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+    )
+    args = parser.parse_args()
+
+    documents = make_raw_documents(args.docs)
+    schema = BenchDocSchema()
+    start = time.perf_counter()
+    expected = schema.dump_raw(documents, many=True)
+    reference = time.perf_counter() - start
+    print("%s documents, %s CPUs" % (args.docs, os.cpu_count()))
+    print("%-12s %.2fs" % ("dump_raw", reference))
+    for workers in args.workers:
+        start = time.perf_counter()
+        dumped = list(
+            schema.parallel_dump(documents, workers=workers, batch_size=args.batch_size)
+        )
+        elapsed = time.perf_counter() - start
+        assert dumped == expected
+        print(
+            "%-12s %.2fs (x%.1f)"
+            % ("%s workers" % workers, elapsed, reference / elapsed)
+        )
+
+
+if __name__ == "__main__":
+    main()
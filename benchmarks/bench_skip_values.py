@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the dump of documents with many fields when the ``model_skip_values``
+are filtered while dumping the fields (current behaviour) and when they are
+filtered by a ``post_dump`` hook rebuilding each dumped dict.
+
+Usage: python benchmarks/bench_skip_values.py [--fields 60] [--docs 1000]
+"""
+
+import argparse
+import timeit
+
+import marshmallow as ma
+import mongoengine as me
+
+from marshmallow_mongoengine import ModelSchema
+
+
+def make_model(fields_count):
+    attrs = {}
+    for i in range(fields_count):
+        if i % 3 == 0:
+            attrs["int_%s" % i] = me.IntField()
+        elif i % 3 == 1:
+            attrs["str_%s" % i] = me.StringField()
+        else:
+            attrs["list_%s" % i] = me.ListField(me.StringField())
+    return type("BenchDoc", (me.Document,), attrs)
+
+
+def make_documents(model, docs_count):
+    docs = []
+    for i in range(docs_count):
+        values = {}
+        for j, field_name in enumerate(model._fields_ordered):
+            if field_name == "id" or (i + j) % 4 == 0:
+                # Leave some fields unset to be skipped
+                continue
+            if field_name.startswith("int_"):
+                values[field_name] = j
+            elif field_name.startswith("str_"):
+                values[field_name] = "value %s" % j
+            else:
+                values[field_name] = ["a", "b"] if j % 2 else []
+        docs.append(model(**values))
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fields", type=int, default=60)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    doc_model = make_model(args.fields)
+    docs = make_documents(doc_model, args.docs)
+
+    class Schema(ModelSchema):
+        class Meta:
+            model = doc_model
+
+    class PostDumpSchema(ModelSchema):
+        class Meta:
+            model = doc_model
+            model_skip_values = ()
+
+        def _serialize_items(self, obj, many):
+            return ma.Schema._serialize(self, obj, many=many)
+
+        @ma.post_dump
+        def _remove_skip_values(self, data, **kwargs):
+            to_skip = (None, [], {})
+            return {key: value for key, value in data.items() if value not in to_skip}
+
+    schema, post_dump_schema = Schema(), PostDumpSchema()
+    assert schema.dump(docs, many=True) == post_dump_schema.dump(docs, many=True)
+    print("%s documents of %s fields" % (args.docs, args.fields))
+    for name, schema_ in (("post_dump hook", post_dump_schema), ("dump loop", schema)):
+        timings = timeit.repeat(
+            lambda: schema_.dump(docs, many=True), number=1, repeat=args.repeat
+        )
+        print("%-15s best of %s: %.3fs" % (name, args.repeat, min(timings)))
+
+
+if __name__ == "__main__":
+    main()
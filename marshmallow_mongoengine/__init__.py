@@ -25,6 +25,8 @@ from marshmallow_mongoengine.convert import (
     field_for,
 )
 from marshmallow_mongoengine.exceptions import ModelConversionError
+from marshmallow_mongoengine.references import IdentityMap
+from marshmallow_mongoengine.bulk import BulkResult
 
 __version__ = "0.31.2"
 __license__ = "MIT"
@@ -42,4 +44,6 @@ __all__ = [
     "fields",
     "register_field_builder",
     "register_field",
+    "IdentityMap",
+    "BulkResult",
 ]
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk writes of validated payloads, see `ModelSchema.bulk_update`,
+`ModelSchema.load_and_insert` and `ModelSchema.bulk_upsert`.
+"""
+
+import contextlib
+import itertools
+from collections.abc import Mapping
+
+from marshmallow import ValidationError
+from marshmallow.decorators import POST_LOAD
+from marshmallow.exceptions import SCHEMA
+from mongoengine.base import BaseDocument
+from mongoengine.base.document import NON_FIELD_ERRORS
+from mongoengine.errors import (
+    InvalidQueryError,
+    ValidationError as MongoValidationError,
+)
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from marshmallow_mongoengine import references, updates
+
+
+class BulkResult(object):
+    """Outcome of a bulk operation, reported by position of the items in the
+    input. ::
+
+        result = BookSchema().bulk_update(items)
+        for index, messages in result.errors.items():
+            print(items[index], messages)
+
+    The counts are the ones reported by MongoDB for the whole operation.
+    """
+
+    def __init__(self):
+        #: Number of items processed
+        self.count = 0
+        #: Errors by item position: the validation error messages, or
+        #: ``{"_schema": [message]}`` for the write errors
+        self.errors = {}
+        #: Ids of the inserted (or upserted) documents by item position
+        self.ids = {}
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "<BulkResult count=%s errors=%s>" % (self.count, len(self.errors))
+
+    @property
+    def ok(self):
+        """True if all the items have been written"""
+        return not self.errors
+
+    @property
+    def succeeded(self):
+        """Positions of the items written without error"""
+        return [index for index in range(self.count) if index not in self.errors]
+
+    def add_write_details(self, indexes, details):
+        """Report the result `details` (``bulk_api_result`` or
+        `BulkWriteError.details`) of the write of the items at `indexes`.
+        """
+        for write_error in details.get("writeErrors", ()):
+            index = indexes[write_error["index"]]
+            self.errors[index] = {SCHEMA: [write_error["errmsg"]]}
+        for upserted in details.get("upserted", ()):
+            self.ids[indexes[upserted["index"]]] = upserted["_id"]
+        self.inserted_count += details.get("nInserted", 0)
+        self.matched_count += details.get("nMatched", 0)
+        self.modified_count += details.get("nModified", 0)
+        self.upserted_count += details.get("nUpserted", 0)
+
+
+def iter_chunks(items, chunk_size):
+    """Yield the (position, item) pairs of `items` by lists of `chunk_size`"""
+    items = enumerate(items)
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_write(collection, indexes, requests, result):
+    """Write `requests` (made for the items at `indexes`) with one unordered
+    `bulk_write`, reporting to `result`.
+    """
+    try:
+        details = collection.bulk_write(requests, ordered=False).bulk_api_result
+    except BulkWriteError as error:
+        details = error.details
+    result.add_write_details(indexes, details)
+
+
+def get_filter(model, query):
+    """Return the raw filter of `query`: the keyword arguments of a
+    `QuerySet` as a dict, a document or a primary key.
+    """
+    if isinstance(query, BaseDocument):
+        query = query.pk
+    if not isinstance(query, dict):
+        query = {"pk": query}
+    return model.objects(**query)._query
+
+
+@contextlib.contextmanager
+def chunk_references_scope(schema, payloads):
+    """Resolve the references of all the `payloads` of a chunk at once, for
+    the loads done in the ``with`` block.
+    """
+    with references.batch_scope(
+        schema.context.get("identity_map"),
+        existence_only=schema.opts.model_references_existence_only,
+    ):
+        if schema.opts.model_batch_references:
+            to_fetch = references.ReferenceSet()
+            for data in payloads:
+                references.collect_references(schema, data, to_fetch)
+            references.prefetch_references(to_fetch)
+        yield
+
+
+def bulk_update(schema, items, chunk_size=1000, append=()):
+    """
+    Update the documents of the (query, payload) `items` with one
+    `bulk_write` per chunk of `chunk_size` items, see
+    `ModelSchema.bulk_update`.
+    """
+    model = schema.opts.model
+    collection = model._get_collection()
+    result = BulkResult()
+    for chunk in iter_chunks(items, chunk_size):
+        result.count += len(chunk)
+        indexes = []
+        requests = []
+        with chunk_references_scope(schema, [data for _, (_, data) in chunk]):
+            for index, (query, data) in chunk:
+                if not isinstance(data, Mapping):
+                    result.errors[index] = {SCHEMA: [schema.error_messages["type"]]}
+                    continue
+                try:
+                    query = get_filter(model, query)
+                except (MongoValidationError, InvalidQueryError) as error:
+                    result.errors[index] = {SCHEMA: [str(error)]}
+                    continue
+                try:
+                    spec = updates.get_update_spec(schema, data, append=append)
+                except ValidationError as error:
+                    result.errors[index] = error.normalized_messages()
+                    continue
+                if spec:
+                    indexes.append(index)
+                    requests.append(UpdateOne(query, spec))
+        if requests:
+            bulk_write(collection, indexes, requests, result)
+    return result
+
+
+def get_document_messages(error):
+    """Return the messages of the mongoengine `error` raised by
+    `Document.validate`, as the messages of a `ValidationError`.
+    """
+    if not error.errors:
+        return {SCHEMA: [error.message]}
+    return {
+        SCHEMA if key == NON_FIELD_ERRORS else key: (
+            [message] if isinstance(message, str) else message
+        )
+        for key, message in error.to_dict().items()
+    }
+
+
+def load_chunk(schema, chunk, result):
+    """Load the (position, payload) pairs of `chunk` with one ``many=True``
+    load, reporting the invalid payloads to `result`. The documents are validated
+    (including `clean`) as by `save`.
+
+    :return: The (position, document) pairs of the valid payloads
+    """
+    try:
+        loaded = schema.load([data for _, data in chunk], many=True)
+    except ValidationError as error:
+        messages = error.normalized_messages()
+        if not all(isinstance(position, int) for position in messages):
+            # Errors of the whole chunk (e.g. `validates_schema(pass_many=True)`)
+            for index, _ in chunk:
+                result.errors[index] = messages
+            return []
+        for position, item_messages in messages.items():
+            result.errors[chunk[position][0]] = item_messages
+        valid_data = [
+            item_data
+            for position, item_data in enumerate(error.valid_data)
+            if position not in messages
+        ]
+        chunk = [
+            item for position, item in enumerate(chunk) if position not in messages
+        ]
+        if not chunk:
+            return []
+        # Run the post load hooks skipped because of the invalid payloads
+        try:
+            loaded = schema._invoke_load_processors(
+                POST_LOAD,
+                valid_data,
+                many=True,
+                original_data=[data for _, data in chunk],
+                partial=None,
+            )
+        except ValidationError as error:
+            for index, _ in chunk:
+                result.errors[index] = error.normalized_messages()
+            return []
+    model = schema.opts.model
+    documents = []
+    for (index, _), obj in zip(chunk, loaded):
+        document = obj if isinstance(obj, model) else model(**obj)
+        try:
+            document.validate()
+        except MongoValidationError as error:
+            result.errors[index] = get_document_messages(error)
+            continue
+        documents.append((index, document))
+    return documents
+
+
+def load_and_insert(schema, data, chunk_size=1000):
+    """
+    Load the payloads of `data` and insert the valid ones with one
+    `insert_many` per chunk of `chunk_size` payloads, see
+    `ModelSchema.load_and_insert`.
+    """
+    collection = schema.opts.model._get_collection()
+    result = BulkResult()
+    for chunk in iter_chunks(data, chunk_size):
+        result.count += len(chunk)
+        documents = load_chunk(schema, chunk, result)
+        if not documents:
+            continue
+        indexes = [index for index, _ in documents]
+        sons = [document.to_mongo() for _, document in documents]
+        try:
+            collection.insert_many(sons, ordered=False)
+            details = {"nInserted": len(sons)}
+        except BulkWriteError as error:
+            details = error.details
+        result.add_write_details(indexes, details)
+        for index, son in zip(indexes, sons):
+            if index not in result.errors:
+                # Set by `insert_many` when missing
+                result.ids[index] = son["_id"]
+    return result
+
+
+def bulk_upsert(schema, data, key, chunk_size=1000):
+    """
+    Update the existing documents of the payloads of `data` (identified by
+    their `key` field) and insert the others, with one `bulk_write` per chunk
+    of `chunk_size` payloads, see `ModelSchema.bulk_upsert`.
+    """
+    model = schema.opts.model
+    field = schema.load_fields.get(key)
+    attr = (field.attribute or key) if field is not None else key
+    if field is None or attr not in model._fields:
+        raise ValueError("`%s` is not a field of the schema and the model" % key)
+    data_key = field.data_key if field.data_key is not None else key
+    db_field = model._fields[attr].db_field
+    collection = model._get_collection()
+    result = BulkResult()
+    for chunk in iter_chunks(data, chunk_size):
+        result.count += len(chunk)
+        keyed = {}
+        for index, payload in chunk:
+            if not isinstance(payload, Mapping):
+                result.errors[index] = {SCHEMA: [schema.error_messages["type"]]}
+                continue
+            try:
+                if payload.get(data_key) is None:
+                    raise ValidationError(field.error_messages["required"])
+                value = field.deserialize(payload[data_key], data_key, payload)
+            except ValidationError as error:
+                result.errors[index] = {data_key: error.messages}
+                continue
+            if value in keyed:
+                result.errors[index] = {data_key: ["Duplicated in the batch."]}
+                continue
+            keyed[value] = (index, payload)
+        if not keyed:
+            continue
+        query = get_filter(model, {"%s__in" % attr: list(keyed)})
+        projection = {db_field: True}
+        if db_field != "_id":
+            projection["_id"] = False
+        existing = {
+            document[db_field] for document in collection.find(query, projection)
+        }
+        indexes = []
+        requests = []
+        created = []
+        documents = []
+        with chunk_references_scope(schema, [payload for _, payload in keyed.values()]):
+            for value, (index, payload) in keyed.items():
+                if model._fields[attr].to_mongo(value) not in existing:
+                    created.append((index, payload))
+                    continue
+                # The key is only used to find the document
+                changes = {k: v for k, v in payload.items() if k != data_key}
+                try:
+                    spec = updates.get_update_spec(schema, changes)
+                except ValidationError as error:
+                    result.errors[index] = error.normalized_messages()
+                    continue
+                if spec:
+                    indexes.append(index)
+                    requests.append(UpdateOne(get_filter(model, {attr: value}), spec))
+            if created:
+                for index, document in load_chunk(schema, created, result):
+                    indexes.append(index)
+                    son = document.to_mongo()
+                    documents.append((index, son))
+                    requests.append(InsertOne(son))
+        if requests:
+            bulk_write(collection, indexes, requests, result)
+        for index, son in documents:
+            if index not in result.errors:
+                # Set by `bulk_write` when missing
+                result.ids[index] = son["_id"]
+    return result
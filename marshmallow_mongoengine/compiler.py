@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Generate dump functions specialized for the fields of a `ModelSchema`, see
+`ModelSchema.compile`.
+"""
+
+import functools
+
+import marshmallow as ma
+from marshmallow import fields as ma_fields
+from marshmallow.utils import ensure_text_type
+from mongoengine.base import BaseDocument
+
+from marshmallow_mongoengine import fields
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_source(source):
+    # Schemas with the same fields layout share the generated code
+    return compile(source, "<marshmallow_mongoengine compiled dump>", "exec")
+
+
+def _dump_nested(field, value):
+    # Same as `Nested._serialize`, compiling the nested schema as well
+    schema = field.schema
+    if value is None:
+        return None
+    if getattr(schema, "_compiled_dump", False) is None:
+        schema.compile()
+    return schema.dump(value, many=schema.many or field.many)
+
+
+class _DumpGenerator(object):
+    def __init__(self, schema):
+        self.schema = schema
+        self.namespace = {
+            "missing": ma.missing,
+            "BaseDocument": BaseDocument,
+            "ensure_text_type": ensure_text_type,
+            "dump_nested": _dump_nested,
+            "dict_class": schema.dict_class,
+            "get_attribute": schema.get_attribute,
+            "skip_value": schema._skip_value,
+            "fallback": schema._serialize_item,
+        }
+        self.lines = [
+            "def dump(obj):",
+            "    if not isinstance(obj, BaseDocument):",
+            "        return fallback(obj)",
+            "    ret = dict_class()",
+        ]
+
+    def bind(self, value):
+        name = "f%s" % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def serialize_expr(self, field, var, attr, depth=0):
+        """Return the expression serializing `var` like `field._serialize`"""
+        serialize = type(field)._serialize
+        if serialize is ma_fields.Field._serialize:
+            return var
+        if serialize is ma_fields.String._serialize:
+            return (
+                "None if {0} is None else "
+                "({0} if type({0}) is str else ensure_text_type({0}))".format(var)
+            )
+        if (
+            serialize is ma_fields.Number._serialize
+            and type(field)._format_num is ma_fields.Number._format_num
+            and not field.as_string
+            and field.num_type in (int, float)
+        ):
+            return "None if {0} is None else {1}({0})".format(
+                var, field.num_type.__name__
+            )
+        if serialize is fields.ObjectId._serialize:
+            return "missing if {0} is None else str({0})".format(var)
+        if serialize is fields.Point._serialize:
+            return (
+                "missing if {0} is None else "
+                'dict(x={0}["coordinates"][0], y={0}["coordinates"][1])'.format(var)
+            )
+        if serialize is ma_fields.List._serialize:
+            each = "each%s" % depth
+            inner = self.serialize_expr(field.inner, each, attr, depth + 1)
+            return "None if {0} is None else [{1} for {2} in {0}]".format(
+                var, inner, each
+            )
+        if serialize is ma_fields.Nested._serialize:
+            return "dump_nested(%s, %s)" % (self.bind(field), var)
+        return "%s._serialize(%s, %r, obj)" % (self.bind(field), var, attr)
+
+    def access_expr(self, field_name, field):
+        """Return the expression getting the value of `field` from `obj`,
+        like `field.get_value` with `ModelSchema.get_attribute`"""
+        attr = field.attribute or field_name
+        if "." in attr:
+            return "get_attribute(obj, %r, missing)" % attr
+        if attr in self.schema._raw_reference_attrs:
+            return (
+                "obj._data.get({0}, missing) if {0} in obj._fields "
+                "else getattr(obj, {0}, missing)".format(repr(attr))
+            )
+        return "getattr(obj, %r, missing)" % attr
+
+    def keep_expr(self):
+        skip_value = self.schema._skip_value
+        if skip_value is None:
+            return "value is not missing"
+        from marshmallow_mongoengine.schema import _is_default_skip_value
+
+        if skip_value is _is_default_skip_value:
+            return (
+                "value is not missing and value is not None and "
+                "not (isinstance(value, (list, dict)) and not value)"
+            )
+        return "value is not missing and not skip_value(value)"
+
+    def add_field(self, field_name, field, key):
+        lines = ["    # %s" % field_name]
+        field_cls = type(field)
+        if (
+            field_cls.serialize is not ma_fields.Field.serialize
+            or field_cls.get_value is not ma_fields.Field.get_value
+        ):
+            lines.append(
+                "    value = %s.serialize(%r, obj, accessor=get_attribute)"
+                % (self.bind(field), field_name)
+            )
+        elif field._CHECK_ATTRIBUTE:
+            lines.append("    value = " + self.access_expr(field_name, field))
+            default = fields.get_dump_default(field)
+            if default is not ma.missing:
+                lines.append("    if value is missing:")
+                default_name = self.bind(default)
+                if callable(default):
+                    lines.append("        value = %s()" % default_name)
+                else:
+                    lines.append("        value = %s" % default_name)
+            lines.append("    if value is not missing:")
+            lines.append(
+                "        value = " + self.serialize_expr(field, "value", field_name)
+            )
+        else:
+            lines.append(
+                "    value = " + self.serialize_expr(field, "None", field_name)
+            )
+        lines.append("    if %s:" % self.keep_expr())
+        lines.append("        ret[%r] = value" % key)
+        self.lines.extend(lines)
+
+    def generate(self):
+        for field_name, field, key in self.schema._dump_items:
+            self.add_field(field_name, field, key)
+        self.lines.append("    return ret")
+        return "\n".join(self.lines) + "\n"
+
+
+def compile_dump(schema):
+    """
+    Generate a function dumping a single document like the dump loop of the
+    `ModelSchema` (without the hooks), inlining the attribute accesses, the
+    conversions of the common fields and the skip values filtering.
+
+    :param schema: `ModelSchema` instance
+    :return: The dump function, falling back to the dump loop of the schema
+        for objects that are not Mongoengine documents
+    """
+    generator = _DumpGenerator(schema)
+    source = generator.generate()
+    namespace = generator.namespace
+    exec(_compile_source(source), namespace)
+    return namespace["dump"]
@@ -1,5 +1,7 @@
 import inspect
 import functools
+import threading
+import weakref
 
 import mongoengine as me
 
@@ -24,10 +26,17 @@ class MetaFieldBuilder(object):
 
     def __init__(self, field):
         self.mongoengine_field = field
-        self.params = [
-            paramCls(field)
-            for paramCls in self.BASE_AVAILABLE_PARAMS + self.AVAILABLE_PARAMS
-        ]
+        self._params = None
+
+    @property
+    def params(self):
+        # Only computed when building a field instance
+        if self._params is None:
+            self._params = [
+                paramCls(self.mongoengine_field)
+                for paramCls in self.BASE_AVAILABLE_PARAMS + self.AVAILABLE_PARAMS
+            ]
+        return self._params
 
     def build_marshmallow_field(self, **kwargs):
         """
@@ -68,7 +77,9 @@ class ReferenceBuilder(MetaFieldBuilder):
 
     def _get_marshmallow_field_cls(self):
         return functools.partial(
-            self.MARSHMALLOW_FIELD_CLS, self.mongoengine_field.document_type
+            self.MARSHMALLOW_FIELD_CLS,
+            self.mongoengine_field.document_type,
+            lazy=_is_lazy_reference(self.mongoengine_field),
         )
 
 
@@ -87,25 +98,39 @@ class GenericReferenceBuilder(MetaFieldBuilder):
         # Special handle for the choice field given it represent the
         # reference's document class
         kwargs["choices"] = getattr(self.mongoengine_field, "choices", None)
+        kwargs.setdefault("lazy", _is_lazy_reference(self.mongoengine_field))
         return super(GenericReferenceBuilder, self).build_marshmallow_field(**kwargs)
 
 
+class GenericEmbeddedDocumentBuilder(MetaFieldBuilder):
+    BASE_AVAILABLE_PARAMS = GenericReferenceBuilder.BASE_AVAILABLE_PARAMS
+    AVAILABLE_PARAMS = ()
+    MARSHMALLOW_FIELD_CLS = ma_fields.GenericEmbeddedDocument
+
+    def build_marshmallow_field(self, **kwargs):
+        # Special handle for the choice field given it represent the
+        # embedded document's class
+        kwargs["choices"] = getattr(self.mongoengine_field, "choices", None)
+        return super(GenericEmbeddedDocumentBuilder, self).build_marshmallow_field(
+            **kwargs
+        )
+
+
 class EmbeddedDocumentBuilder(MetaFieldBuilder):
     AVAILABLE_PARAMS = ()
     MARSHMALLOW_FIELD_CLS = ma_fields.Nested
     BASE_NESTED_SCHEMA_CLS = None
 
     def _get_marshmallow_field_cls(self):
-        # Recursive build of marshmallow schema
-        from marshmallow_mongoengine.schema import ModelSchema
-
-        base_nested_schema_cls = self.BASE_NESTED_SCHEMA_CLS or ModelSchema
+        # The nested schema is only built when first used, which allows
+        # recursive embedded documents
+        field_me = self.mongoengine_field
+        base_nested_schema_cls = self.BASE_NESTED_SCHEMA_CLS
 
-        class NestedSchema(base_nested_schema_cls):
-            class Meta:
-                model = self.mongoengine_field.document_type
+        def get_nested_schema_cls():
+            return NESTED_SCHEMAS.get(field_me.document_type, base_nested_schema_cls)
 
-        return functools.partial(self.MARSHMALLOW_FIELD_CLS, NestedSchema)
+        return functools.partial(self.MARSHMALLOW_FIELD_CLS, get_nested_schema_cls)
 
 
 class MapBuilder(MetaFieldBuilder):
@@ -121,18 +146,48 @@ class MapBuilder(MetaFieldBuilder):
         )
 
 
-def get_field_builder_for_data_type(field_me):
-    field_me_types = inspect.getmro(type(field_me))
-    for field_me_type in field_me_types:
+def _is_lazy_reference(field_me):
+    # LazyReferenceField and GenericLazyReference need mongoengine >= 0.15.0
+    lazy_fields_cls = tuple(
+        getattr(me.fields, name)
+        for name in ("LazyReferenceField", "GenericLazyReferenceField")
+        if hasattr(me.fields, name)
+    )
+    return isinstance(field_me, lazy_fields_cls)
+
+
+def get_field_builder_cls(field_me_cls):
+    """
+    Return the :class MetaFieldBuilder: registered for the given Mongoengine
+    Field class or its closest parent class
+    """
+    try:
+        return _FIELD_BUILDERS_DISPATCH[field_me_cls]
+    except KeyError:
+        pass
+    for field_me_type in inspect.getmro(field_me_cls):
         if field_me_type in FIELD_MAPPING:
-            field_ma_cls = FIELD_MAPPING[field_me_type]
+            builder = FIELD_MAPPING[field_me_type]
             break
     else:
+        builder = None
+    _FIELD_BUILDERS_DISPATCH[field_me_cls] = builder
+    return builder
+
+
+def get_field_builder_for_data_type(field_me):
+    field_ma_cls = get_field_builder_cls(type(field_me))
+    if field_ma_cls is None:
         raise ModelConversionError("Could not find field of type {0}.".format(field_me))
     return field_ma_cls(field_me)
 
 
 FIELD_MAPPING = {}
+# Incremented each time FIELD_MAPPING changes to invalidate the conversions
+FIELD_MAPPING_VERSION = 0
+# Builder resolved for each Mongoengine Field class (including the
+# subclasses not in FIELD_MAPPING), reset each time FIELD_MAPPING changes
+_FIELD_BUILDERS_DISPATCH = {}
 
 
 def register_field_builder(mongo_field_cls, builder):
@@ -141,7 +196,51 @@ def register_field_builder(mongo_field_cls, builder):
     :param mongo_field_cls: Mongoengine Field
     :param build: field_builder to register
     """
+    global FIELD_MAPPING_VERSION
     FIELD_MAPPING[mongo_field_cls] = builder
+    FIELD_MAPPING_VERSION += 1
+    _FIELD_BUILDERS_DISPATCH.clear()
+
+
+class NestedSchemaRegistry(object):
+    """
+    Thread-safe registry of the schemas of the embedded documents, building
+    one schema class per (embedded document, base schema class, Meta
+    options) the first time it is requested
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._mapping_version = FIELD_MAPPING_VERSION
+        self._schemas = weakref.WeakKeyDictionary()
+
+    def get(self, document_type, base_schema_cls=None, **options):
+        """
+        :param document_type: Mongoengine EmbeddedDocument
+        :param base_schema_cls: Schema class to inherit from (default:
+            :class ModelSchema:)
+        :param options: Additional Meta options of the schema
+        :return: The schema class for the given document
+        """
+        if base_schema_cls is None:
+            from marshmallow_mongoengine.schema import ModelSchema
+
+            base_schema_cls = ModelSchema
+        key = (base_schema_cls, frozenset(options.items()))
+        with self._lock:
+            # Schemas built before a field (builder) was registered
+            # are outdated
+            if self._mapping_version != FIELD_MAPPING_VERSION:
+                self._schemas.clear()
+                self._mapping_version = FIELD_MAPPING_VERSION
+            schemas = self._schemas.setdefault(document_type, {})
+            if key not in schemas:
+                meta = type("Meta", (object,), dict(options, model=document_type))
+                schemas[key] = type("NestedSchema", (base_schema_cls,), {"Meta": meta})
+            return schemas[key]
+
+
+NESTED_SCHEMAS = NestedSchemaRegistry()
 
 
 def register_field(mongo_field_cls, marshmallow_field_cls, available_params=()):
@@ -178,8 +277,8 @@ register_field(
 register_field(
     me.fields.FloatField, ma_fields.Float, available_params=(params.SizeParam,)
 )
-register_field(
-    me.fields.GenericEmbeddedDocumentField, ma_fields.GenericEmbeddedDocument
+register_field_builder(
+    me.fields.GenericEmbeddedDocumentField, GenericEmbeddedDocumentBuilder
 )
 register_field_builder(me.fields.GenericReferenceField, GenericReferenceBuilder)
 register_field_builder(me.fields.ReferenceField, ReferenceBuilder)
@@ -1,4 +1,11 @@
 # -*- coding: utf-8 -*-
+import collections
+import copy
+import threading
+import weakref
+
+from marshmallow import fields as ma_fields
+
 from marshmallow_mongoengine.conversion import fields
 
 
@@ -6,14 +13,102 @@ def _is_field(value):
     return isinstance(value, type) and issubclass(value, fields.Field)
 
 
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "currsize"])
+
+
+class _FieldsCache(object):
+    """Fields converted by `ModelConverter.fields_for_model`, keyed by model
+    then by (converter class, fields subset, per-field kwargs).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._mapping_version = fields.FIELD_MAPPING_VERSION
+        self._models = weakref.WeakKeyDictionary()
+
+    def get(self, model, key):
+        with self._lock:
+            # Conversions made before a field (builder) was registered
+            # are outdated
+            if self._mapping_version != fields.FIELD_MAPPING_VERSION:
+                self._models.clear()
+                self._mapping_version = fields.FIELD_MAPPING_VERSION
+            result = self._models.get(model, {}).get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def set(self, model, key, result):
+        with self._lock:
+            self._models.setdefault(model, {})[key] = result
+
+    def info(self):
+        with self._lock:
+            currsize = sum(len(results) for results in self._models.values())
+            return CacheInfo(self.hits, self.misses, currsize)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self.hits = self.misses = 0
+
+
+_fields_cache = _FieldsCache()
+
+
+def _get_cache_key(converter, fields_kwargs, fields):
+    key = (
+        type(converter),
+        frozenset(fields) if fields else None,
+        frozenset(
+            (field_name, frozenset(kwargs.items()))
+            for field_name, kwargs in fields_kwargs.items()
+        ),
+    )
+    try:
+        hash(key)
+    except TypeError:
+        # Unhashable kwargs (e.g. list of validators), cannot be cached
+        return None
+    return key
+
+
 class ModelConverter(object):
     """Class that converts a mongoengine Document into a dictionary of
     corresponding marshmallow `Fields <marshmallow.fields.Field>`.
+
+    The conversions done by `fields_for_model` are cached (see `cache_info`)
+    and each call returns copies of the cached fields.
     """
 
+    @staticmethod
+    def cache_info():
+        """Return the hits, misses and current size of the
+        `fields_for_model` cache.
+        """
+        return _fields_cache.info()
+
+    @staticmethod
+    def clear_cache():
+        _fields_cache.clear()
+
     def fields_for_model(self, model, fields_kwargs=None, fields=None):
-        result = {}
         fields_kwargs = fields_kwargs or {}
+        key = _get_cache_key(self, fields_kwargs, fields)
+        result = None if key is None else _fields_cache.get(model, key)
+        if result is None:
+            result = self._fields_for_model(model, fields_kwargs, fields)
+            if key is not None:
+                _fields_cache.set(model, key, result)
+        # Copy to prevent alteration of the cached fields
+        return {field_name: copy.copy(field) for field_name, field in result.items()}
+
+    def _fields_for_model(self, model, fields_kwargs, fields):
+        result = {}
         for field_name, field_me in model._fields.items():
             if fields and field_name not in fields:
                 continue
@@ -31,12 +126,32 @@ class ModelConverter(object):
             return field_builder.marshmallow_field_cls
         return field_builder.build_marshmallow_field(**kwargs)
 
-    def field_for(self, model, property_name, **kwargs):
+    def field_for(self, model, property_name, defer=False, **kwargs):
+        if defer:
+            return DeferredField(self, model, property_name, **kwargs)
         field_me = getattr(model, property_name)
         field_builder = fields.get_field_builder_for_data_type(field_me)
         return field_builder.build_marshmallow_field(**kwargs)
 
 
+class DeferredField(ma_fields.Field):
+    """Placeholder returned by `field_for` with ``defer=True``, converted
+    when the fields of the `ModelSchema` it is declared in are.
+    """
+
+    def __init__(self, converter, model, property_name, **kwargs):
+        super(DeferredField, self).__init__()
+        self.converter = converter
+        self.model = model
+        self.property_name = property_name
+        self.field_kwargs = kwargs
+
+    def convert(self):
+        return self.converter.field_for(
+            self.model, self.property_name, **self.field_kwargs
+        )
+
+
 default_converter = ModelConverter()
 
 
@@ -72,6 +187,9 @@ Example: ::
 
 :param type ,: A Mongoengine Document mapped class.
 :param str property_name: The name of the property to convert.
+:param bool defer: If `True`, return a placeholder converted along with the
+    fields of the `ModelSchema` it is declared in (see the
+    ``model_defer_conversion`` option).
 :param kwargs: Extra keyword arguments to pass to `property2field`
 :return: A `marshmallow.fields.Field` class or instance.
 """
@@ -1,16 +1,25 @@
 import bson
+import datetime as dt
 import uuid
 from bson.errors import BSONError
 from marshmallow import ValidationError, fields, missing
-from mongoengine import ValidationError as MongoValidationError, NotRegistered
+from mongoengine import (
+    EmbeddedDocument,
+    NotRegistered,
+    ValidationError as MongoValidationError,
+)
 from mongoengine.base import get_document
 
+from marshmallow_mongoengine import references
+
 # Republish default fields...
 from marshmallow.fields import *  # noqa
 
 
 class ObjectId(fields.Field):
     def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, bson.ObjectId):
+            return value
         try:
             return bson.ObjectId(value)
         except BSONError:
@@ -22,6 +31,21 @@ class ObjectId(fields.Field):
         return str(value)
 
 
+class DateTime(fields.DateTime):
+    def _deserialize(self, value, attr, data, **kwargs):
+        # Native datetimes (e.g. decoded from BSON) are loaded as is
+        if isinstance(value, dt.datetime):
+            return value
+        return super(DateTime, self)._deserialize(value, attr, data, **kwargs)
+
+
+class Date(fields.Date):
+    def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, dt.date) and not isinstance(value, dt.datetime):
+            return value
+        return super(Date, self)._deserialize(value, attr, data, **kwargs)
+
+
 class Point(fields.Field):
     def _deserialize(self, value, attr, data, **kwargs):
         try:
@@ -63,10 +87,32 @@ class Reference(fields.Field):
 
     """
     Marshmallow custom field to map with :class Mongoengine.ReferenceField:
+
+    :param existence_only: Only check the referenced document exists when
+        loading, and return a `DBRef` to it instead of the document (default:
+        the ``model_references_existence_only`` option of the schema)
+    :param lazy: Return a `LazyReference` instead of a `DBRef` when only
+        checking the existence of the document
+    :param populate: Dump the referenced document instead of its pk, with
+        the given schema class or, if `True`, with a `ModelSchema` of the
+        document class. When dumping many documents, all the referenced
+        documents are fetched with one query per document class. The pk of
+        a removed document is dumped instead
     """
 
-    def __init__(self, document_type_obj, *args, **kwargs):
+    def __init__(
+        self,
+        document_type_obj,
+        *args,
+        existence_only=None,
+        lazy=False,
+        populate=False,
+        **kwargs
+    ):
         self.document_type_obj = document_type_obj
+        self.existence_only = existence_only
+        self.lazy = lazy
+        self.populate = populate
         super(Reference, self).__init__(*args, **kwargs)
 
     @property
@@ -81,7 +127,14 @@ class Reference(fields.Field):
             if isinstance(value, dict):
                 return document_type(**value)
 
-            return document_type.objects.get(pk=value)
+            if references.is_existence_only(self):
+                pk = references.check_reference(document_type, value)
+                if self.lazy:
+                    from mongoengine.base import LazyReference
+
+                    return LazyReference(document_type, pk)
+                return bson.DBRef(document_type._get_collection_name(), pk)
+            return references.fetch_reference(document_type, value)
         except (
             document_type.DoesNotExist,
             MongoValidationError,
@@ -94,14 +147,20 @@ class Reference(fields.Field):
         return value
 
     def _serialize(self, value, attr, obj, **kwargs):
-        # Only return the pk of the document for serialization
         if value is None:
             return missing
-        return (
-            str(value.pk)
-            if isinstance(value.pk, (bson.ObjectId, uuid.UUID))
-            else value.pk
-        )
+        if self.populate:
+            dumped = references.dump_populated_reference(
+                self, value, self.document_type
+            )
+            if dumped is not None:
+                return dumped
+        # Only return the pk of the document for serialization
+        pk = references.get_reference_pk(value)
+        return str(pk) if isinstance(pk, (bson.ObjectId, uuid.UUID)) else pk
+
+    def get_populate_schema(self, document_type):
+        return _get_populate_schema(self, document_type)
 
 
 class GenericReference(fields.Field):
@@ -110,12 +169,25 @@ class GenericReference(fields.Field):
     Marshmallow custom field to map with :class Mongoengine.GenericReferenceField:
 
     :param choices: List of Mongoengine document class (or class name) allowed
+    :param existence_only: Only check the referenced document exists when
+        loading, and return a `{_cls, _ref}` dict instead of the document
+        (default: the ``model_references_existence_only`` option of the schema)
+    :param lazy: Return a `LazyReference` instead of a `{_cls, _ref}` dict
+        when only checking the existence of the document
+    :param populate: Dump the referenced document instead of its pk, with
+        the given schema class or, if `True`, with a `ModelSchema` of the
+        document class. The pk of a removed document is dumped instead
 
     .. note:: Without `choices` param, this field allow to reference to
         any document in the application which can be a security issue.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self, *args, existence_only=None, lazy=False, populate=False, **kwargs
+    ):
+        self.existence_only = existence_only
+        self.lazy = lazy
+        self.populate = populate
         self.document_class_choices = []
         choices = kwargs.pop("choices", None)
         if choices:
@@ -127,12 +199,15 @@ class GenericReference(fields.Field):
                     self.document_class_choices.append(choice)
         super(GenericReference, self).__init__(*args, **kwargs)
 
-    def _deserialize(self, value, attr, data, **kwargs):
+    def get_document_class(self, value):
+        """
+        Return the document class referenced by `value`, a dict with
+        `id` and `_cls` fields, enforcing the allowed choices
+        """
         # To deserialize a generic reference, we need a _cls field in addition
         # with the id field
         if not isinstance(value, dict) or not value.get("id") or not value.get("_cls"):
             raise ValidationError("Need a dict with 'id' and '_cls' fields")
-        doc_id = value["id"]
         doc_cls_name = value["_cls"]
         if (
             self.document_class_choices
@@ -143,42 +218,163 @@ class GenericReference(fields.Field):
                 % (doc_cls_name, self.document_class_choices)
             )
         try:
-            doc_cls = get_document(doc_cls_name)
+            return get_document(doc_cls_name)
         except NotRegistered:
             raise ValidationError("Invalid _cls field `%s`" % doc_cls_name)
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        doc_cls = self.get_document_class(value)
+        doc_id = value["id"]
+        doc_cls_name = value["_cls"]
         try:
-            doc = doc_cls.objects.get(pk=doc_id)
+            if references.is_existence_only(self):
+                pk = references.check_reference(doc_cls, doc_id)
+                if self.lazy:
+                    from mongoengine.base import LazyReference
+
+                    return LazyReference(doc_cls, pk)
+                return {
+                    "_cls": doc_cls._class_name,
+                    "_ref": bson.DBRef(doc_cls._get_collection_name(), pk),
+                }
+            doc = references.fetch_reference(doc_cls, doc_id)
         except (doc_cls.DoesNotExist, MongoValidationError, ValueError, TypeError):
             raise ValidationError("unknown document %s `%s`" % (doc_cls_name, value))
         return doc
 
     def _serialize(self, value, attr, obj, **kwargs):
-        # Only return the pk of the document for serialization
         if value is None:
             return missing
-        return str(value.pk) if isinstance(value.pk, bson.ObjectId) else value.pk
+        if self.populate:
+            document_type = references.get_reference_document_type(value)
+            if document_type is not None:
+                dumped = references.dump_populated_reference(self, value, document_type)
+                if dumped is not None:
+                    return dumped
+        # Only return the pk of the document for serialization
+        pk = references.get_reference_pk(value)
+        return str(pk) if isinstance(pk, bson.ObjectId) else pk
+
+    def get_populate_schema(self, document_type):
+        return _get_populate_schema(self, document_type)
+
+
+def _get_populate_schema(field, document_type):
+    schemas = field.__dict__.setdefault("_populate_schemas", {})
+    if document_type not in schemas:
+        if field.populate is True:
+            from marshmallow_mongoengine.schema import ModelSchema
+
+            class PopulateSchema(ModelSchema):
+                class Meta:
+                    model = document_type
+
+            schemas[document_type] = PopulateSchema()
+        else:
+            schemas[document_type] = field.populate()
+    return schemas[document_type]
+
+
+def get_dump_default(field):
+    """Return the ``dump_default`` of `field` (named ``default`` before
+    marshmallow 3.13): a value or a callable, `missing` if there is none
+    """
+    if hasattr(field, "dump_default"):
+        return field.dump_default
+    return field.default
 
 
 class GenericEmbeddedDocument(fields.Field):
 
     """
     Dynamic embedded document
+
+    The document is loaded with the schema of the class named by its `_cls`
+    field, without it the document class is unknown and the field is ignored.
+
+    :param choices: List of Mongoengine embedded document class (or class
+        name) allowed
+    :param include_cls: Dump the class name of the document in a `_cls` field,
+        so the dumped data can be loaded back (default: False)
     """
 
+    def __init__(self, *args, include_cls=False, **kwargs):
+        self.include_cls = include_cls
+        self.document_class_choices = []
+        choices = kwargs.pop("choices", None)
+        if choices:
+            for choice in choices:
+                if hasattr(choice, "_class_name"):
+                    self.document_class_choices.append(choice._class_name)
+                else:
+                    self.document_class_choices.append(choice)
+        self._schemas = {}
+        super(GenericEmbeddedDocument, self).__init__(*args, **kwargs)
+
+    def get_schema(self, document_type):
+        """
+        Return the schema instance used to (de)serialize the embedded
+        documents of type `document_type`
+        """
+        schema = self._schemas.get(document_type)
+        if schema is None:
+            from marshmallow_mongoengine.conversion.fields import NESTED_SCHEMAS
+
+            schema = self._schemas.setdefault(
+                document_type, NESTED_SCHEMAS.get(document_type)()
+            )
+        return schema
+
+    def get_document_class(self, value):
+        """
+        Return the embedded document class of `value`, a dict with a `_cls`
+        field, enforcing the allowed choices
+        """
+        if not isinstance(value, dict) or not value.get("_cls"):
+            raise ValidationError("Need a dict with a '_cls' field")
+        doc_cls_name = value["_cls"]
+        if (
+            self.document_class_choices
+            and doc_cls_name not in self.document_class_choices
+        ):
+            raise ValidationError(
+                "Invalid _cls field `%s`, must be one of %s"
+                % (doc_cls_name, self.document_class_choices)
+            )
+        try:
+            doc_cls = get_document(doc_cls_name)
+        except NotRegistered:
+            doc_cls = None
+        if doc_cls is None or not issubclass(doc_cls, EmbeddedDocument):
+            raise ValidationError("Invalid _cls field `%s`" % doc_cls_name)
+        return doc_cls
+
     def _deserialize(self, value, attr, data, **kwargs):
-        # Cannot deserialize given we have no way knowing wich kind of
-        # document is given...
-        return missing
+        if not isinstance(value, dict) or not value.get("_cls"):
+            # Cannot deserialize given we have no way knowing wich kind of
+            # document is given...
+            return missing
+        doc_cls = self.get_document_class(value)
+        value = {k: v for k, v in value.items() if k != "_cls"}
+        try:
+            return self.get_schema(doc_cls).load(value)
+        except ValidationError as error:
+            raise ValidationError(error.messages, valid_data=error.valid_data)
 
     def _serialize(self, value, attr, obj, **kwargs):
-        # Create the schema at serialize time to be dynamic
-        from marshmallow_mongoengine.schema import ModelSchema
-
-        class NestedSchema(ModelSchema):
-            class Meta:
-                model = type(value)
-
-        return NestedSchema().dump(value)
+        if value is None:
+            return missing
+        if isinstance(value, dict):
+            # Raw embedded document
+            doc_cls_name = value.get("_cls")
+            doc_cls = get_document(doc_cls_name)
+        else:
+            doc_cls_name = value._class_name
+            doc_cls = type(value)
+        data = self.get_schema(doc_cls).dump(value)
+        if self.include_cls:
+            data["_cls"] = doc_cls_name
+        return data
 
 
 class Map(fields.Field):
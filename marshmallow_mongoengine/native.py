@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Dumps keeping the values natively supported by BSON (`ObjectId`, `datetime`,
+`Decimal128`, `UUID`...) instead of converting them to JSON compatible
+values, see `ModelSchema.dump_native` and `ModelSchema.dump_bson`, and loads
+of BSON documents, see `ModelSchema.load_bson`.
+"""
+
+import contextlib
+import contextvars
+import datetime as dt
+import decimal
+import struct
+
+import bson
+from bson.binary import UuidRepresentation
+from bson.codec_options import CodecOptions
+from bson.decimal128 import Decimal128
+from bson.errors import InvalidBSON
+from bson.raw_bson import RawBSONDocument
+from marshmallow import fields as ma_fields, missing
+
+from marshmallow_mongoengine import fields, references
+
+CODEC_OPTIONS = CodecOptions(uuid_representation=UuidRepresentation.STANDARD)
+RAW_CODEC_OPTIONS = CODEC_OPTIONS.with_options(document_class=RawBSONDocument)
+
+# Fields whose values are dumped natively
+NATIVE_FIELDS = (
+    ma_fields.List,
+    ma_fields.DateTime,
+    ma_fields.Decimal,
+    ma_fields.UUID,
+    fields.ObjectId,
+    fields.Reference,
+    fields.GenericReference,
+)
+
+_native_dump = contextvars.ContextVar("native_dump", default=False)
+
+
+@contextlib.contextmanager
+def native_dump():
+    token = _native_dump.set(True)
+    try:
+        yield
+    finally:
+        _native_dump.reset(token)
+
+
+def in_native_dump():
+    return _native_dump.get()
+
+
+def serialize_field(field, attr, obj, accessor):
+    """Same as `field.serialize`, keeping the BSON native values"""
+    overridden = type(field).serialize is not ma_fields.Field.serialize
+    if overridden or not field._CHECK_ATTRIBUTE:
+        return field.serialize(attr, obj, accessor=accessor)
+    value = field.get_value(obj, attr, accessor=accessor)
+    if value is missing:
+        default = fields.get_dump_default(field)
+        value = default() if callable(default) else default
+    if value is missing:
+        return value
+    return serialize_value(field, value, attr, obj)
+
+
+def serialize_value(field, value, attr, obj):
+    """Same as `field._serialize`, keeping the BSON native values"""
+    if value is None or not isinstance(field, NATIVE_FIELDS):
+        return field._serialize(value, attr, obj)
+    if isinstance(field, ma_fields.List):
+        return [serialize_value(field.inner, item, attr, obj) for item in value]
+    if isinstance(field, (fields.Reference, fields.GenericReference)):
+        if field.populate:
+            return field._serialize(value, attr, obj)
+        return references.get_reference_pk(value)
+    if isinstance(field, ma_fields.Decimal):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value))
+        return Decimal128(value)
+    if isinstance(field, ma_fields.Date) and not isinstance(value, dt.datetime):
+        # BSON only knows datetimes
+        return dt.datetime.combine(value, dt.time())
+    return value
+
+
+def encode(data, as_document=False):
+    """Encode a dumped document to BSON bytes, or to a `RawBSONDocument` if
+    `as_document` is true.
+    """
+    encoded = bson.encode(data, codec_options=CODEC_OPTIONS)
+    if as_document:
+        return RawBSONDocument(encoded, codec_options=RAW_CODEC_OPTIONS)
+    return encoded
+
+
+_int32 = struct.Struct("<i")
+
+# Size of the BSON values by element type, when fixed
+_FIXED_SIZES = {
+    0x01: 8,  # double
+    0x06: 0,  # undefined
+    0x07: 12,  # ObjectId
+    0x08: 1,  # boolean
+    0x09: 8,  # UTC datetime
+    0x0A: 0,  # null
+    0x10: 4,  # int32
+    0x11: 8,  # timestamp
+    0x12: 8,  # int64
+    0x13: 16,  # decimal128
+    0x7F: 0,  # max key
+    0xFF: 0,  # min key
+}
+
+
+def _get_value_size(raw, element_type, position):
+    size = _FIXED_SIZES.get(element_type)
+    if size is not None:
+        return size
+    if element_type in (0x02, 0x0D, 0x0E):  # string, code, symbol
+        return 4 + _int32.unpack_from(raw, position)[0]
+    if element_type in (0x03, 0x04, 0x0F):  # document, array, code with scope
+        return _int32.unpack_from(raw, position)[0]
+    if element_type == 0x05:  # binary
+        return 5 + _int32.unpack_from(raw, position)[0]
+    if element_type == 0x0B:  # regex
+        pattern_end = raw.index(b"\x00", position)
+        return raw.index(b"\x00", pattern_end + 1) + 1 - position
+    if element_type == 0x0C:  # DBPointer
+        return 4 + _int32.unpack_from(raw, position)[0] + 12
+    raise InvalidBSON("unknown element type %#x" % element_type)
+
+
+def iter_elements(raw):
+    """Yield the (key, start, end) positions of the top-level elements of the
+    BSON document `raw`, without decoding their values.
+    """
+    if len(raw) < 5 or _int32.unpack_from(raw)[0] != len(raw) or raw[-1] != 0:
+        raise InvalidBSON("invalid document size")
+    position = 4
+    end = len(raw) - 1
+    try:
+        while position < end:
+            key_end = raw.index(b"\x00", position + 1)
+            key = raw[position + 1 : key_end].decode("utf-8")
+            value_start = key_end + 1
+            element_end = value_start + _get_value_size(raw, raw[position], value_start)
+            if element_end > end:
+                raise InvalidBSON("element `%s` overflows the document" % key)
+            yield key, position, element_end
+            position = element_end
+    except (ValueError, struct.error) as error:
+        raise InvalidBSON(str(error))
+
+
+def decode_element(raw, key, start, end):
+    """Decode the value of the element of `raw` between `start` and `end`"""
+    element = raw[start:end]
+    document = _int32.pack(len(element) + 5) + element + b"\x00"
+    return bson.decode(document, codec_options=CODEC_OPTIONS)[key]
+
+
+def to_loadable_value(field, value):
+    """Convert the BSON native `value` to a value `field` can deserialize"""
+    if isinstance(field, ma_fields.List) and isinstance(value, list):
+        return [to_loadable_value(field.inner, item) for item in value]
+    if isinstance(field, ma_fields.Nested):
+        schema = field.schema
+        if isinstance(value, list):
+            return [to_loadable_document(schema, item) for item in value]
+        return to_loadable_document(schema, value)
+    if isinstance(value, dt.datetime) and isinstance(field, ma_fields.DateTime):
+        if isinstance(field, ma_fields.Date):
+            value = value.date()
+        if isinstance(field, (fields.DateTime, fields.Date)):
+            # Loaded as is, without formatting and parsing it back
+            return value
+        # Formatted as expected by the field (`format` param)
+        return field._serialize(value, None, None)
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return value
+
+
+def to_loadable_document(schema, document):
+    if not isinstance(document, dict):
+        return document
+    fields_by_key = get_load_fields_by_key(schema)
+    return {
+        key: (
+            to_loadable_value(fields_by_key[key], value)
+            if key in fields_by_key
+            else value
+        )
+        for key, value in document.items()
+    }
+
+
+def get_load_fields_by_key(schema):
+    return {
+        field.data_key if field.data_key is not None else field_name: field
+        for field_name, field in schema.load_fields.items()
+    }
+
+
+def decode_document(schema, raw, include_unknown=False):
+    """
+    Decode the BSON document `raw` (bytes or `RawBSONDocument`) to load it
+    with `schema`. Only the values of the fields loaded by `schema` are
+    decoded, the other keys are kept with a None value to be reported (or
+    excluded) as unknown fields, unless `include_unknown` is true.
+    """
+    if isinstance(raw, RawBSONDocument):
+        raw = raw.raw
+    fields_by_key = get_load_fields_by_key(schema)
+    document = {}
+    for key, start, end in iter_elements(raw):
+        field = fields_by_key.get(key)
+        if field is not None:
+            value = decode_element(raw, key, start, end)
+            document[key] = to_loadable_value(field, value)
+        elif include_unknown:
+            document[key] = decode_element(raw, key, start, end)
+        else:
+            document[key] = None
+    return document
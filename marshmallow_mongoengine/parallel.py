@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel dump of large result sets with a process pool, see
+`ModelSchema.parallel_dump`.
+"""
+
+import collections
+import importlib
+import itertools
+
+import mongoengine as me
+from mongoengine.base import BaseDocument
+
+# Schemas rebuilt in the worker processes, by (schema path, schema kwargs)
+_worker_schemas = {}
+
+
+def get_schema_path(schema_cls):
+    """Return the import path (``module:qualname``) of `schema_cls`"""
+    qualname = schema_cls.__qualname__
+    if "<locals>" in qualname:
+        raise ValueError(
+            "%s must be importable to be used by the worker processes, "
+            "it cannot be defined in a function" % qualname
+        )
+    return "%s:%s" % (schema_cls.__module__, qualname)
+
+
+def import_schema(schema_path):
+    """Return the schema class of the given ``module:qualname`` path"""
+    module_name, qualname = schema_path.split(":")
+    schema_cls = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        schema_cls = getattr(schema_cls, name)
+    return schema_cls
+
+
+def _dump_chunk(schema_path, schema_kwargs, chunk):
+    # Run in the worker processes
+    key = (schema_path, schema_kwargs)
+    schema = _worker_schemas.get(key)
+    if schema is None:
+        schema = import_schema(schema_path)(**dict(schema_kwargs))
+        _worker_schemas[key] = schema
+    return schema.dump_raw(chunk, many=True)
+
+
+def _iter_raw_documents(objs):
+    if isinstance(objs, me.QuerySet) and objs._result_cache is None:
+        objs = objs.no_cache()
+    if isinstance(objs, me.queryset.base.BaseQuerySet):
+        objs = objs.as_pymongo()
+    for obj in objs:
+        if isinstance(obj, BaseDocument):
+            obj = obj.to_mongo().to_dict()
+        yield obj
+
+
+def parallel_dump(
+    schema_path, schema_kwargs, objs, executor, batch_size=1000, max_pending=None
+):
+    """
+    Dump `objs` by chunks of `batch_size` documents in the worker processes of
+    `executor`, yielding the dumped chunks in order.
+
+    The workers receive raw pymongo documents: querysets are read with
+    `as_pymongo` and documents are converted with `to_mongo`.
+
+    :param schema_path: Import path of the schema class (see `get_schema_path`)
+    :param schema_kwargs: Tuple of (name, value) kwargs to build the schema with
+    :param max_pending: Maximum number of chunks being dumped at once (default:
+        twice the number of workers)
+    """
+    if max_pending is None:
+        max_pending = 2 * getattr(executor, "_max_workers", 1)
+    documents = _iter_raw_documents(objs)
+    pending = collections.deque()
+    while True:
+        while len(pending) < max_pending:
+            chunk = list(itertools.islice(documents, batch_size))
+            if not chunk:
+                break
+            pending.append(
+                executor.submit(_dump_chunk, schema_path, schema_kwargs, chunk)
+            )
+        if not pending:
+            return
+        yield pending.popleft().result()
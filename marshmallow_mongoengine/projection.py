@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+QuerySet projections derived from the dumped fields of a schema, see
+`ModelSchema.get_projection`.
+"""
+
+from marshmallow_mongoengine import fields as ma_fields
+
+
+def _get_nested_schema(field):
+    if isinstance(field, ma_fields.List):
+        field = field.inner
+    if isinstance(field, ma_fields.Nested):
+        return field.schema
+    return None
+
+
+def get_projection(schema, db_field=False, _seen=()):
+    """
+    Walk the dump fields of `schema` and its nested schemas, see
+    `ModelSchema.get_projection`.
+    """
+    model = getattr(schema.opts, "model", None)
+    if model is None:
+        return None
+    _seen = _seen + (type(schema),)
+    paths = []
+    for field_name, field in schema.dump_fields.items():
+        if isinstance(field, ma_fields.Skip):
+            continue
+        attr = (field.attribute or field_name).split(".")[0]
+        field_me = model._fields.get(attr)
+        if field_me is None:
+            return None
+        path = field_me.db_field if db_field else attr
+        nested_schema = _get_nested_schema(field)
+        nested_paths = None
+        # Recursive embedded documents are fully projected
+        if nested_schema is not None and type(nested_schema) not in _seen:
+            nested_paths = get_projection(nested_schema, db_field=db_field, _seen=_seen)
+        if nested_paths:
+            paths.extend("%s.%s" % (path, nested_path) for nested_path in nested_paths)
+        else:
+            paths.append(path)
+    return paths
@@ -0,0 +1,502 @@
+# -*- coding: utf-8 -*-
+import collections
+import contextlib
+import contextvars
+from collections.abc import Mapping
+
+from bson import DBRef
+from marshmallow import ValidationError
+from mongoengine import NotRegistered, ValidationError as MongoValidationError
+from mongoengine.base import BaseDocument, get_document
+
+# Identity map activated with a ``with`` statement
+_active_identity_map = contextvars.ContextVar(
+    "marshmallow_mongoengine_identity_map", default=None
+)
+# References resolution state of the payload currently loaded
+_current_batch = contextvars.ContextVar("marshmallow_mongoengine_batch", default=None)
+
+
+class IdentityMap(object):
+    """Cache of the documents fetched to resolve references, keyed by
+    (document class, primary key).
+
+    Use it as a context manager to share it between all the loads done
+    in the ``with`` block, or provide it to a schema with the
+    ``identity_map`` context key. ::
+
+        with IdentityMap(maxsize=1000) as identity_map:
+            books = BookSchema().load(payload, many=True)
+            reviews = ReviewSchema().load(other_payload, many=True)
+        print(identity_map.hits, identity_map.misses)
+
+    :param maxsize: Maximum number of documents kept, the least recently
+        used ones being discarded first (default: no limit)
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        #: Number of lookups resolved from the cache
+        self.hits = 0
+        #: Number of lookups that required a query
+        self.misses = 0
+        self._documents = collections.OrderedDict()
+        self._tokens = []
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, key):
+        return key in self._documents
+
+    def get(self, document_type, pk, default=None):
+        """Return the cached document, counting the lookup as a hit or a miss."""
+        key = (document_type, pk)
+        try:
+            document = self._documents[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._documents.move_to_end(key)
+        self.hits += 1
+        return document
+
+    def put(self, document_type, pk, document):
+        key = (document_type, pk)
+        self._documents[key] = document
+        self._documents.move_to_end(key)
+        if self.maxsize is not None and len(self._documents) > self.maxsize:
+            self._documents.popitem(last=False)
+
+    def clear(self):
+        self._documents.clear()
+        self.hits = self.misses = 0
+
+    def __enter__(self):
+        self._tokens.append(_active_identity_map.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_identity_map.reset(self._tokens.pop())
+
+
+class _Batch(object):
+    def __init__(self, identity_map, existence_only=False):
+        self.identity_map = identity_map
+        # `model_references_existence_only` option of the loaded schema,
+        # applying to the references of its nested schemas as well
+        self.existence_only = existence_only
+        # Documents prefetched for this payload, kept regardless of the
+        # identity map size
+        self.documents = {}
+        # References only checked for existence
+        self.existing = set()
+        self.missing = set()
+
+
+class ReferenceSet(object):
+    """Primary keys referenced by a payload, grouped by document class."""
+
+    def __init__(self):
+        #: Dict of {document class: set of primary keys} to fetch
+        self.documents = {}
+        #: Dict of {document class: set of primary keys} to check the
+        #: existence of
+        self.ids = {}
+
+    def add(self, document_type, pk, existence_only=False):
+        references = self.ids if existence_only else self.documents
+        references.setdefault(document_type, set()).add(pk)
+
+
+def get_pk_key(document_type, value):
+    """Convert `value` into the python type of `document_type`'s primary key.
+
+    :raise ValueError: If `value` cannot be a primary key of `document_type`
+    """
+    try:
+        pk_field = document_type._fields[document_type._meta["id_field"]]
+        key = pk_field.to_python(value)
+        pk_field.validate(key)
+        hash(key)
+    except (KeyError, MongoValidationError, ValueError, TypeError):
+        raise ValueError(
+            "invalid primary key for %s `%s`" % (document_type._class_name, value)
+        )
+    return key
+
+
+def get_reference_pk(value):
+    """Return the primary key of a referenced document without
+    dereferencing it.
+
+    :param value: Document, `DBRef`, `LazyReference`, raw primary key or
+        `{_cls, _ref}` dict as stored by a `GenericReferenceField`
+    """
+    if isinstance(value, Mapping) and "_ref" in value:
+        value = value["_ref"]
+    if isinstance(value, BaseDocument):
+        return value.pk
+    if isinstance(value, DBRef):
+        return value.id
+    return value
+
+
+def get_reference_document_type(value):
+    """Return the class of a document referenced by a `GenericReferenceField`
+    without dereferencing it, or None if it cannot be known.
+    """
+    if isinstance(value, Mapping) and "_cls" in value:
+        try:
+            return get_document(value["_cls"])
+        except NotRegistered:
+            return None
+    if isinstance(value, BaseDocument):
+        return type(value)
+    # LazyReference
+    return getattr(value, "document_type", None)
+
+
+def is_reference_field(field):
+    """Return True if `field` (or the inner field of a `List`) only needs
+    the primary keys of the referenced documents to be dumped.
+    """
+    from marshmallow_mongoengine import fields as ma_fields
+
+    while isinstance(field, ma_fields.List):
+        field = field.inner
+    return isinstance(field, (ma_fields.Reference, ma_fields.GenericReference))
+
+
+def is_existence_only(field):
+    """Return True if the `Reference` or `GenericReference` `field` only
+    checks the existence of the referenced documents when loading, either
+    from its own ``existence_only`` param or from the
+    ``model_references_existence_only`` option of its schema or of the
+    schema loading it as nested.
+    """
+    if field.existence_only is not None:
+        return field.existence_only
+    batch = _current_batch.get()
+    if batch is not None and batch.existence_only:
+        return True
+    opts = getattr(field.root, "opts", None)
+    return getattr(opts, "model_references_existence_only", False)
+
+
+@contextlib.contextmanager
+def batch_scope(identity_map=None, existence_only=False):
+    """Resolve the references of a payload using `identity_map` (default to
+    the one activated with a ``with`` statement, if any) and keep the
+    documents prefetched with :func:`prefetch_references` until the scope
+    is left. If `existence_only`, the references are only checked for
+    existence, unless their field says otherwise.
+    """
+    if identity_map is None:
+        identity_map = _active_identity_map.get()
+    token = _current_batch.set(_Batch(identity_map, existence_only))
+    try:
+        yield
+    finally:
+        _current_batch.reset(token)
+
+
+def in_batch_scope():
+    return _current_batch.get() is not None
+
+
+def prefetch_references(references):
+    """Resolve all the given references with one `$in` query per
+    document class, only projecting the primary key of the documents
+    whose existence is checked.
+
+    :param references: :class:`ReferenceSet` to resolve
+    """
+    batch = _current_batch.get()
+    if batch is None:
+        return
+    identity_map = batch.identity_map
+    for document_type, keys in references.documents.items():
+        to_fetch = []
+        for key in keys:
+            if (document_type, key) in batch.documents:
+                continue
+            document = None
+            if identity_map is not None:
+                document = identity_map.get(document_type, key)
+            if document is None:
+                to_fetch.append(key)
+            else:
+                batch.documents[(document_type, key)] = document
+        if not to_fetch:
+            continue
+        for document in document_type.objects(pk__in=to_fetch):
+            batch.documents[(document_type, document.pk)] = document
+            if identity_map is not None:
+                identity_map.put(document_type, document.pk, document)
+        for key in to_fetch:
+            if (document_type, key) not in batch.documents:
+                batch.missing.add((document_type, key))
+    for document_type, keys in references.ids.items():
+        to_check = [
+            key
+            for key in keys
+            if (document_type, key) not in batch.documents
+            and (document_type, key) not in batch.existing
+            and (identity_map is None or (document_type, key) not in identity_map)
+        ]
+        if not to_check:
+            continue
+        id_field = document_type._meta["id_field"]
+        batch.existing.update(
+            (document_type, key)
+            for key in document_type.objects(pk__in=to_check).scalar(id_field)
+        )
+        for key in to_check:
+            if (document_type, key) not in batch.existing:
+                batch.missing.add((document_type, key))
+
+
+def fetch_reference(document_type, value):
+    """Return the `document_type` document with `value` as primary key,
+    using the prefetched documents and the identity map if any.
+
+    :raise document_type.DoesNotExist: If there is no such document
+    """
+    batch = _current_batch.get()
+    identity_map = (
+        batch.identity_map if batch is not None else _active_identity_map.get()
+    )
+    if batch is None and identity_map is None:
+        return document_type.objects.get(pk=value)
+    try:
+        key = get_pk_key(document_type, value)
+    except ValueError:
+        # Let the query report the error
+        return document_type.objects.get(pk=value)
+    if batch is not None:
+        document = batch.documents.get((document_type, key))
+        if document is not None:
+            return document
+        if (document_type, key) in batch.missing:
+            raise document_type.DoesNotExist()
+    if identity_map is not None:
+        document = identity_map.get(document_type, key)
+        if document is not None:
+            return document
+    document = document_type.objects.get(pk=value)
+    if identity_map is not None:
+        identity_map.put(document_type, key, document)
+    return document
+
+
+def check_reference(document_type, value):
+    """Check the `document_type` document with `value` as primary key
+    exists, using the prefetched references and the identity map if any,
+    without fetching it.
+
+    :return: The primary key of the document
+    :raise document_type.DoesNotExist: If there is no such document
+    :raise ValueError: If `value` is not a valid primary key
+    """
+    key = get_pk_key(document_type, value)
+    batch = _current_batch.get()
+    identity_map = (
+        batch.identity_map if batch is not None else _active_identity_map.get()
+    )
+    ref_key = (document_type, key)
+    if batch is not None:
+        if ref_key in batch.documents or ref_key in batch.existing:
+            return key
+        if ref_key in batch.missing:
+            raise document_type.DoesNotExist()
+    if identity_map is not None and identity_map.get(document_type, key) is not None:
+        return key
+    id_field = document_type._meta["id_field"]
+    if document_type.objects(pk=key).scalar(id_field).first() is None:
+        raise document_type.DoesNotExist()
+    if batch is not None:
+        batch.existing.add(ref_key)
+    return key
+
+
+def collect_references(schema, data, references):
+    """Collect the primary keys of the documents referenced by the
+    `Reference` and `GenericReference` fields of `schema` in the payload
+    `data`, including the ones in lists and nested schemas.
+
+    :param references: :class:`ReferenceSet` updated in place
+    """
+    if not isinstance(data, Mapping):
+        return
+    referenced_fields = getattr(schema, "referenced_fields", None)
+    if referenced_fields is None:
+        referenced_fields = get_referenced_fields(schema)
+    for field_name, field in referenced_fields.items():
+        data_key = field.data_key if field.data_key is not None else field_name
+        value = data.get(data_key)
+        if value is not None:
+            _collect_field_references(field, value, references)
+
+
+def has_references(schema, _seen=()):
+    """Return True if the load fields of `schema` contain `Reference` or
+    `GenericReference` fields, directly or in lists, dicts and nested schemas.
+    """
+    seen = _seen + (type(schema),)
+    return any(
+        _field_has_references(field, seen) for field in schema.load_fields.values()
+    )
+
+
+def get_referenced_fields(schema):
+    """Return the load fields of `schema` containing references to resolve,
+    directly or in lists, dicts and nested schemas.
+    """
+    seen = (type(schema),)
+    return {
+        field_name: field
+        for field_name, field in schema.load_fields.items()
+        if _field_has_references(field, seen)
+    }
+
+
+def _field_has_references(field, seen):
+    from marshmallow_mongoengine import fields as ma_fields
+
+    while True:
+        if isinstance(field, ma_fields.List):
+            field = field.inner
+        elif isinstance(field, ma_fields.Mapping):
+            field = field.value_field
+        else:
+            break
+    if isinstance(field, (ma_fields.Reference, ma_fields.GenericReference)):
+        return True
+    if isinstance(field, ma_fields.Nested):
+        nested_schema = field.schema
+        # Stop on recursive schemas
+        return type(nested_schema) not in seen and has_references(nested_schema, seen)
+    return False
+
+
+def _collect_field_references(field, value, references):
+    from marshmallow_mongoengine import fields as ma_fields
+
+    if isinstance(field, ma_fields.Reference):
+        # A dict is an embedded version of the document, nothing to fetch
+        if isinstance(value, dict):
+            return
+        document_type = field.document_type
+        try:
+            key = get_pk_key(document_type, value)
+        except ValueError:
+            # Let the field report the error
+            return
+        references.add(document_type, key, is_existence_only(field))
+    elif isinstance(field, ma_fields.GenericReference):
+        # Group the references by document class
+        try:
+            document_type = field.get_document_class(value)
+            key = get_pk_key(document_type, value["id"])
+        except (ValidationError, ValueError):
+            # Let the field report the error
+            return
+        references.add(document_type, key, is_existence_only(field))
+    elif isinstance(field, ma_fields.List):
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                if item is not None:
+                    _collect_field_references(field.inner, item, references)
+    elif isinstance(field, ma_fields.Nested):
+        if field.many:
+            if isinstance(value, (list, tuple)):
+                for item in value:
+                    collect_references(field.schema, item, references)
+        else:
+            collect_references(field.schema, value, references)
+
+
+def dump_populated_reference(field, value, document_type):
+    """Dump the `document_type` document referenced by `value` with the
+    populate schema of the `Reference` or `GenericReference` `field`,
+    using the prefetched documents and the identity map if any.
+
+    :return: The dumped document, or None if it does not exist anymore
+    """
+    if isinstance(value, BaseDocument):
+        document = value
+    else:
+        try:
+            document = fetch_reference(document_type, get_reference_pk(value))
+        except document_type.DoesNotExist:
+            return None
+    return field.get_populate_schema(type(document)).dump(document)
+
+
+def get_populated_fields(schema, _seen=()):
+    """Return the dump fields of `schema` containing references to populate,
+    directly or in lists and nested schemas.
+    """
+    from marshmallow_mongoengine import fields as ma_fields
+
+    populated_fields = {}
+    seen = _seen + (type(schema),)
+    for field_name, field in schema.dump_fields.items():
+        inner = field
+        while isinstance(inner, ma_fields.List):
+            inner = inner.inner
+        if isinstance(inner, (ma_fields.Reference, ma_fields.GenericReference)):
+            if inner.populate:
+                populated_fields[field_name] = field
+        elif isinstance(inner, ma_fields.Nested):
+            nested_schema = inner.schema
+            # Stop on recursive schemas
+            if type(nested_schema) not in seen and get_populated_fields(
+                nested_schema, seen
+            ):
+                populated_fields[field_name] = field
+    return populated_fields
+
+
+def collect_dump_references(schema, obj, references):
+    """Collect the primary keys of the documents to populate when dumping
+    `obj` with `schema`.
+
+    :param references: :class:`ReferenceSet` updated in place
+    """
+    populated_fields = getattr(schema, "populated_fields", None)
+    if populated_fields is None:
+        populated_fields = get_populated_fields(schema)
+    for field_name, field in populated_fields.items():
+        value = schema.get_attribute(obj, field.attribute or field_name, None)
+        if value is not None:
+            _collect_field_dump_references(field, value, references)
+
+
+def _collect_field_dump_references(field, value, references):
+    from marshmallow_mongoengine import fields as ma_fields
+
+    if isinstance(field, (ma_fields.Reference, ma_fields.GenericReference)):
+        if isinstance(value, BaseDocument):
+            # Already fetched
+            return
+        if isinstance(field, ma_fields.Reference):
+            document_type = field.document_type
+        else:
+            document_type = get_reference_document_type(value)
+            if document_type is None:
+                return
+        try:
+            key = get_pk_key(document_type, get_reference_pk(value))
+        except ValueError:
+            return
+        references.add(document_type, key)
+    elif isinstance(field, ma_fields.List):
+        for item in value:
+            if item is not None:
+                _collect_field_dump_references(field.inner, item, references)
+    elif isinstance(field, ma_fields.Nested):
+        for item in value if field.many else [value]:
+            if item is not None:
+                collect_dump_references(field.schema, item, references)
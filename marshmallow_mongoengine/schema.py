@@ -1,13 +1,66 @@
 # -*- coding: utf-8 -*-
+import concurrent.futures
+import contextvars
 import copy
+import itertools
+import threading
+from collections.abc import Sequence
 
+from bson.errors import InvalidBSON
+import mongoengine as me
 from mongoengine.base import BaseDocument
 import marshmallow as ma
-from marshmallow_mongoengine.convert import ModelConverter
+from marshmallow_mongoengine import (
+    bulk,
+    compiler,
+    native,
+    parallel,
+    projection,
+    references,
+    updates,
+    writers,
+)
+from marshmallow_mongoengine.convert import DeferredField, ModelConverter
 
 
 DEFAULT_SKIP_VALUES = (None, [], {})
 
+_conversion_lock = threading.RLock()
+
+# Set while dumping raw pymongo documents, see `ModelSchema.dump_raw`
+_dump_raw_documents = contextvars.ContextVar("dump_raw_documents", default=False)
+
+# Fields whose raw value differs from the value of the document attribute
+RAW_CONVERTED_FIELDS = (
+    me.fields.ComplexDateTimeField,
+    me.fields.DecimalField,
+    me.fields.UUIDField,
+)
+
+
+def _is_raw_converted(field_me):
+    # Lists and maps are converted by their own `to_python`, item by item
+    while isinstance(field_me, (me.fields.ListField, me.fields.DictField)):
+        field_me = field_me.field
+    return isinstance(field_me, RAW_CONVERTED_FIELDS)
+
+
+def _is_default_skip_value(value):
+    # Same as `value in DEFAULT_SKIP_VALUES` without comparing each
+    # value with `==`
+    return value is None or (isinstance(value, (list, dict)) and not value)
+
+
+def _get_skip_value_check(skip_values):
+    """Return a function telling if a dumped value is one of `skip_values`,
+    or None if no value is skipped.
+    """
+    if not skip_values:
+        return None
+    if skip_values is DEFAULT_SKIP_VALUES or skip_values == DEFAULT_SKIP_VALUES:
+        return _is_default_skip_value
+    return lambda value: value in skip_values
+
 
 class SchemaOpts(ma.SchemaOpts):
     """Options class for `ModelSchema`.
@@ -26,6 +79,22 @@ class SchemaOpts(ma.SchemaOpts):
         (default: False)
     - ``model_skip_values``: Skip the field if it contains one of the given
         values (default: None, [] and {})
+    - ``model_batch_references``: If true, the documents referenced in the
+        loaded data are fetched with one query per document class instead of
+        one query per reference (default: True)
+    - ``model_references_existence_only``: If true, the reference fields
+        (including the ones of the embedded documents) only check the
+        referenced documents exist when loading and return a
+        `DBRef` (or `LazyReference`) instead of the document. Can be
+        overridden per field with the ``existence_only`` param (default: False)
+    - ``model_compile``: If true, the schema is compiled when instantiated
+        (see `ModelSchema.compile`) (default: False)
+    - ``model_defer_conversion``: If true, the Mongoengine Document model is
+        converted when the schema is first instantiated, subclassed or its
+        declared fields accessed instead of when the schema class is defined
+        (default: False)
+    - ``model_upsert_key``: Name of the unique field identifying the
+        documents in `ModelSchema.bulk_upsert` (default: None)
     """
 
     def __init__(self, meta, *args, **kwargs):
@@ -40,6 +109,13 @@ class SchemaOpts(ma.SchemaOpts):
         self.model_converter = getattr(meta, "model_converter", ModelConverter)
         self.model_build_obj = getattr(meta, "model_build_obj", True)
         self.model_skip_values = getattr(meta, "model_skip_values", DEFAULT_SKIP_VALUES)
+        self.model_batch_references = getattr(meta, "model_batch_references", True)
+        self.model_references_existence_only = getattr(
+            meta, "model_references_existence_only", False
+        )
+        self.model_defer_conversion = getattr(meta, "model_defer_conversion", False)
+        self.model_compile = getattr(meta, "model_compile", False)
+        self.model_upsert_key = getattr(meta, "model_upsert_key", None)
 
 
 class SchemaMeta(ma.schema.SchemaMeta):
@@ -51,6 +127,32 @@ class SchemaMeta(ma.schema.SchemaMeta):
         """Updates declared fields with fields converted from the
         Mongoengine model passed as the `model` class Meta option.
         """
+        if klass.opts.model_defer_conversion:
+            # Converted on first access, see `_declared_fields`
+            klass._deferred_conversion_args = (args, kwargs)
+            return None
+        return mcs._convert_declared_fields(klass, *args, **kwargs)
+
+    @property
+    def _declared_fields(cls):
+        declared_fields = cls.__dict__["_converted_declared_fields"]
+        if declared_fields is None:
+            with _conversion_lock:
+                declared_fields = cls.__dict__["_converted_declared_fields"]
+                if declared_fields is None:
+                    args, kwargs = cls._deferred_conversion_args
+                    declared_fields = type(cls)._convert_declared_fields(
+                        cls, *args, **kwargs
+                    )
+                    cls._converted_declared_fields = declared_fields
+        return declared_fields
+
+    @_declared_fields.setter
+    def _declared_fields(cls, value):
+        cls._converted_declared_fields = value
+
+    @classmethod
+    def _convert_declared_fields(mcs, klass, *args, **kwargs):
         declared_fields = kwargs.get("dict_class", dict)()
         # Generate the fields provided through inheritance
         opts = klass.opts
@@ -63,6 +165,9 @@ class SchemaMeta(ma.schema.SchemaMeta):
         # Generate the fields provided in the current class
         base_fields = super(SchemaMeta, mcs).get_declared_fields(klass, *args, **kwargs)
         declared_fields.update(base_fields)
+        for field_name, field in declared_fields.items():
+            if isinstance(field, DeferredField):
+                declared_fields[field_name] = field.convert()
         # Customize fields with provided kwargs
         for field_name, field_kwargs in klass.opts.model_fields_kwargs.items():
             field = declared_fields.get(field_name, None)
@@ -101,10 +206,366 @@ class ModelSchema(ma.Schema, metaclass=SchemaMeta):
 
     OPTIONS_CLASS = SchemaOpts
 
-    @ma.post_dump
-    def _remove_skip_values(self, data, **kwargs):
-        to_skip = self.opts.model_skip_values
-        return {key: value for key, value in data.items() if value not in to_skip}
+    @property
+    def _declared_fields(self):
+        # Resolved on the class given the fields may not be converted yet
+        return type(self)._declared_fields
+
+    def _init_fields(self):
+        super(ModelSchema, self)._init_fields()
+        # References are dumped from the raw values stored in the document to
+        # avoid fetching the referenced documents just to get their pk
+        self._raw_reference_attrs = set(
+            field.attribute or field_name
+            for field_name, field in self.dump_fields.items()
+            if references.is_reference_field(field)
+        )
+        self._populated_fields = None
+        self._referenced_fields = None
+        self._raw_fields = None
+        # Computed once for all the dumped items, see `_serialize_items`
+        self._dump_items = [
+            (
+                field_name,
+                field,
+                field.data_key if field.data_key is not None else field_name,
+            )
+            for field_name, field in self.dump_fields.items()
+        ]
+        self._skip_value = _get_skip_value_check(self.opts.model_skip_values)
+        # The required fields are loaded as partial by `update`
+        self._update_partial = frozenset(
+            field_name
+            for field_name, field in self.load_fields.items()
+            if field.required
+        )
+        self._compiled_dump = None
+        if self.opts.model_compile:
+            self.compile()
+
+    def compile(self):
+        """Replace the generic dump loop of the schema by a function generated
+        for its fields, which inlines the attribute accesses, the conversions
+        of the common fields and the skip values filtering. Nested schemas
+        are compiled when first used. The dump hooks are still run.
+
+        Schemas overriding `get_attribute` are not compiled.
+
+        :return: True if the schema is compiled
+        """
+        if self._compiled_dump is None:
+            if type(self).get_attribute is not ModelSchema.get_attribute:
+                self._compiled_dump = False
+            else:
+                self._compiled_dump = compiler.compile_dump(self)
+        return bool(self._compiled_dump)
+
+    @property
+    def populated_fields(self):
+        # Computed on first dump given it requires the nested schemas
+        if self._populated_fields is None:
+            self._populated_fields = references.get_populated_fields(self)
+        return self._populated_fields
+
+    @property
+    def referenced_fields(self):
+        # Computed on first load given it requires the nested schemas
+        if self._referenced_fields is None:
+            self._referenced_fields = references.get_referenced_fields(self)
+        return self._referenced_fields
+
+    @property
+    def raw_fields(self):
+        """Dict of {attribute: (db_field, to_python)} used to get the
+        attributes of the model from raw documents, `to_python` being
+        None if the raw value doesn't need to be converted
+        """
+        if self._raw_fields is None:
+            raw_fields = {}
+            for field_name, field_me in getattr(self.opts.model, "_fields", {}).items():
+                to_python = None
+                if _is_raw_converted(field_me):
+                    to_python = field_me.to_python
+                raw_fields[field_name] = (field_me.db_field, to_python)
+            self._raw_fields = raw_fields
+        return self._raw_fields
+
+    def get_attribute(self, obj, attr, default):
+        if isinstance(obj, dict) and _dump_raw_documents.get():
+            db_field, to_python = self.raw_fields.get(attr, (None, None))
+            if db_field is None:
+                return super(ModelSchema, self).get_attribute(obj, attr, default)
+            value = obj.get(db_field, default)
+            if to_python is not None and value is not default and value is not None:
+                value = to_python(value)
+            return value
+        if (
+            attr in self._raw_reference_attrs
+            and isinstance(obj, BaseDocument)
+            and attr in obj._fields
+        ):
+            return obj._data.get(attr, default)
+        return super(ModelSchema, self).get_attribute(obj, attr, default)
+
+    def _deserialize(self, data, *, many=False, **kwargs):
+        # Nested schemas are loaded within the scope of their parent
+        if references.in_batch_scope() or not self.referenced_fields:
+            return super(ModelSchema, self)._deserialize(data, many=many, **kwargs)
+        with references.batch_scope(
+            self.context.get("identity_map"),
+            existence_only=self.opts.model_references_existence_only,
+        ):
+            if self.opts.model_batch_references:
+                if (
+                    many
+                    and ma.utils.is_collection(data)
+                    and not isinstance(data, Sequence)
+                ):
+                    # Iterated twice, once to collect the references
+                    data = list(data)
+                to_fetch = references.ReferenceSet()
+                for item in data if many and ma.utils.is_collection(data) else [data]:
+                    references.collect_references(self, item, to_fetch)
+                references.prefetch_references(to_fetch)
+            return super(ModelSchema, self)._deserialize(data, many=many, **kwargs)
+
+    def _serialize(self, obj, *, many=False):
+        # Nested schemas are dumped within the scope of their parent
+        if references.in_batch_scope() or not self.populated_fields:
+            return self._serialize_items(obj, many)
+        if many and obj is not None and not isinstance(obj, Sequence):
+            # Iterated twice, once to collect the references
+            obj = list(obj)
+        to_fetch = references.ReferenceSet()
+        for item in obj if many and obj is not None else [obj]:
+            references.collect_dump_references(self, item, to_fetch)
+        with references.batch_scope(self.context.get("identity_map")):
+            references.prefetch_references(to_fetch)
+            return self._serialize_items(obj, many)
+
+    def _serialize_items(self, obj, many):
+        if native.in_native_dump():
+            serialize_item = self._serialize_item
+        else:
+            serialize_item = self._compiled_dump or self._serialize_item
+        if many and obj is not None:
+            return [serialize_item(item) for item in obj]
+        return serialize_item(obj)
+
+    def _serialize_item(self, obj):
+        # Same as `Schema._serialize`, dropping the `model_skip_values`
+        # as the fields are dumped
+        ret = self.dict_class()
+        skip_value = self._skip_value
+        get_attribute = self.get_attribute
+        serialize = native.serialize_field if native.in_native_dump() else None
+        for field_name, field, key in self._dump_items:
+            if serialize is None:
+                value = field.serialize(field_name, obj, accessor=get_attribute)
+            else:
+                value = serialize(field, field_name, obj, get_attribute)
+            if value is ma.missing or (skip_value and skip_value(value)):
+                continue
+            ret[key] = value
+        return ret
+
+    def dump_raw(self, obj, *, many=None):
+        """Dump raw documents as returned by pymongo, for instance by
+        `QuerySet.as_pymongo` or `QuerySet.aggregate`, without building the
+        Mongoengine documents.
+
+        The values are read from the ``db_field`` of the model fields (e.g.
+        ``_id`` for the ``id`` field), embedded documents included.
+
+        Example: ::
+
+            UserSchema().dump_raw(User.objects.as_pymongo(), many=True)
+        """
+        token = _dump_raw_documents.set(True)
+        try:
+            return self.dump(obj, many=many)
+        finally:
+            _dump_raw_documents.reset(token)
+
+    def dump_native(self, obj, *, many=None):
+        """Same as `dump`, keeping the values natively supported by BSON
+        (`ObjectId`, `datetime`, `UUID`, `Decimal128`, referenced documents
+        pk...) instead of converting them to strings.
+        """
+        with native.native_dump():
+            return self.dump(obj, many=many)
+
+    def dump_bson(self, obj, *, many=None, as_document=False):
+        """Dump `obj` (see `dump_native`) to BSON bytes, or to
+        `RawBSONDocument` if `as_document` is true. With ``many``, return the
+        list of the encoded documents.
+
+        Example: ::
+
+            producer.send(UserSchema().dump_bson(user))
+        """
+        many = self.many if many is None else bool(many)
+        dumped = self.dump_native(obj, many=many)
+        if many:
+            return [native.encode(data, as_document) for data in dumped]
+        return native.encode(dumped, as_document)
+
+    def load_bson(self, data, *, many=None, partial=None, unknown=None):
+        """Same as `load` for BSON documents (bytes or `RawBSONDocument`),
+        only decoding the values of the fields the schema loads. The BSON
+        native values (`ObjectId`, `datetime`, `Decimal128`...) are accepted.
+
+        Example: ::
+
+            user = UserSchema(only=("name", "email")).load_bson(message.body)
+        """
+        many = self.many if many is None else bool(many)
+        unknown = unknown if unknown is not None else self.unknown
+        include_unknown = unknown == ma.INCLUDE
+        try:
+            if many:
+                data = [
+                    native.decode_document(self, raw, include_unknown) for raw in data
+                ]
+            else:
+                data = native.decode_document(self, data, include_unknown)
+        except InvalidBSON as error:
+            raise ma.ValidationError(
+                "Invalid BSON document: %s" % error, field_name=ma.exceptions.SCHEMA
+            )
+        return self.load(data, many=many, partial=partial, unknown=unknown)
+
+    def get_projection(self, db_field=False):
+        """Return the paths of the model fields the schema dumps, including
+        the paths within the embedded documents, or None if the whole
+        documents are needed (e.g. when dumping `fields.Function`).
+
+        :param db_field: If true, return the ``db_field`` paths (as stored in
+            MongoDB) instead of the field names (as used by `QuerySet.only`)
+        """
+        return projection.get_projection(self, db_field=db_field)
+
+    def dump_queryset(self, qs):
+        """Dump the documents of the `QuerySet` `qs`, only fetching the
+        fields the schema dumps (see `get_projection`).
+
+        Example: ::
+
+            UserSchema(only=("name", "email")).dump_queryset(User.objects)
+        """
+        paths = self.get_projection()
+        if paths is not None:
+            qs = qs.only(*paths)
+        return self.dump(qs, many=True)
+
+    def iter_dump(self, objs, *, batch_size=1000, chunks=False, raw=False):
+        """Dump the documents of `objs` (`QuerySet` or any iterable) by
+        batches of `batch_size` documents, yielding each dumped document
+        (or each batch if `chunks` is true) so the whole result never has to
+        be kept in memory.
+
+        Each batch is dumped as a ``many=True`` dump: the dump hooks and the
+        reference population run once per batch. Querysets are iterated
+        without caching their results.
+
+        :param raw: If true, `objs` are raw pymongo documents (see `dump_raw`)
+
+        Example: ::
+
+            for data in UserSchema().iter_dump(User.objects, batch_size=500):
+                export(data)
+        """
+        if isinstance(objs, me.QuerySet) and objs._result_cache is None:
+            objs = objs.no_cache().batch_size(batch_size)
+        dump = self.dump_raw if raw else self.dump
+        # Querysets restart when iterated again, hence the generator
+        iterator = (obj for obj in objs)
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                return
+            dumped = dump(batch, many=True)
+            if chunks:
+                yield dumped
+            else:
+                yield from dumped
+
+    def dump_to(
+        self,
+        fp,
+        objs,
+        *,
+        format="ndjson",
+        compress=False,
+        encoder=None,
+        buffer_size=64 * 1024,
+        batch_size=1000,
+        raw=False
+    ):
+        """Dump the documents of `objs` (`QuerySet` or any iterable) to the
+        binary file-like object `fp` as they are dumped (see `iter_dump`).
+
+        :param format: ``ndjson`` (one JSON document per line) or ``json``
+            (JSON array of the documents)
+        :param compress: If true, gzip the output
+        :param encoder: Function encoding a dumped document to JSON, as str
+            or bytes (default: the ``dumps`` of the ``render_module`` option)
+        :param buffer_size: Size (in bytes) of the chunks written to `fp`
+        :return: The number of written documents
+
+        Example: ::
+
+            with open("users.ndjson.gz", "wb") as fp:
+                UserSchema().dump_to(fp, User.objects, compress=True)
+        """
+        return writers.write_documents(
+            fp,
+            self.iter_dump(objs, batch_size=batch_size, raw=raw),
+            format=format,
+            compress=compress,
+            encoder=encoder or self.opts.render_module.dumps,
+            buffer_size=buffer_size,
+        )
+
+    def parallel_dump(
+        self, objs, *, workers=None, batch_size=1000, chunks=False, executor=None
+    ):
+        """Dump the documents of `objs` (`QuerySet` or any iterable) by
+        batches of `batch_size` documents in a pool of `workers` processes,
+        yielding each dumped document (or each batch if `chunks` is true) in
+        order.
+
+        The workers import the schema class by its path and dump raw
+        pymongo documents (see `dump_raw`), hence the schema class must be
+        defined at the module level. Only the ``only`` and ``exclude``
+        params of the schema are passed to the workers.
+
+        :param executor: `concurrent.futures.Executor` to use instead of
+            creating a `ProcessPoolExecutor`
+
+        Example: ::
+
+            for data in UserSchema().parallel_dump(User.objects, workers=8):
+                export(data)
+        """
+        schema_path = parallel.get_schema_path(type(self))
+        schema_kwargs = (
+            ("only", tuple(self.only) if self.only is not None else None),
+            ("exclude", tuple(self.exclude)),
+        )
+        if executor is None:
+            with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+                yield from self.parallel_dump(
+                    objs, batch_size=batch_size, chunks=chunks, executor=executor
+                )
+            return
+        for dumped in parallel.parallel_dump(
+            schema_path, schema_kwargs, objs, executor, batch_size=batch_size
+        ):
+            if chunks:
+                yield dumped
+            else:
+                yield from dumped
 
     @ma.post_load
     def _make_object(self, data, **kwargs):
@@ -137,15 +598,12 @@ class ModelSchema(ma.Schema, metaclass=SchemaMeta):
         Note:
 
             Given the update is done on a existing object, the required param
-            on the fields is ignored
-        """
-        # TODO: find a cleaner way to skip required validation on update
-        required_fields = [k for k, f in self.fields.items() if f.required]
-        for field in required_fields:
-            self.fields[field].required = False
-        loaded_data = self._do_load(data, postprocess=False)
-        for field in required_fields:
-            self.fields[field].required = True
+            on the fields is ignored (the fields are not modified, so the
+            schema can be shared between threads)
+        """
+        loaded_data = self._do_load(
+            data, partial=self._update_partial, postprocess=False
+        )
         # Update the given obj fields
         for k, v in loaded_data.items():
             # Skip default values that have been automatically
@@ -153,3 +611,109 @@ class ModelSchema(ma.Schema, metaclass=SchemaMeta):
             if k in data:
                 setattr(obj, k, v)
         return obj
+
+    def get_update_spec(self, data, *, append=()):
+        """Build an atomic update document (``$set``, ``$unset`` and
+        ``$push``) from the partial payload `data`, to update a document
+        without fetching it first.
+
+        The values are loaded as by `update` (the required fields are
+        ignored), converted with the model fields and keyed by their
+        ``db_field``. None values unset the fields, unless they are nullable.
+
+        :param append: Names of the list fields whose loaded values are
+            appended to the stored lists (``$push``) instead of replacing them
+        :return: The update document, empty if there is nothing to update
+
+        Example: ::
+
+            spec = UserSchema().get_update_spec(payload, append=("tags",))
+            if spec:
+                User._get_collection().update_one({"_id": user_id}, spec)
+        """
+        return updates.get_update_spec(self, data, append=append)
+
+    def bulk_update(self, items, *, chunk_size=1000, append=()):
+        """Update many documents from (query, payload) `items` without
+        fetching them: each payload is turned into an update document (see
+        `get_update_spec`), and the updates are written by chunks of
+        `chunk_size` items with one unordered ``bulk_write`` per chunk.
+
+        The query of an item is a document, a primary key or a dict of
+        `QuerySet` keyword arguments. The references of the payloads are
+        resolved once per chunk.
+
+        :return: A `BulkResult` reporting the invalid queries, the validation
+            and the write errors by position of the items. A query matching
+            no document is not an error: only the total
+            ``matched_count`` tells how many documents were found.
+
+        Example: ::
+
+            result = UserSchema().bulk_update(
+                [(user_id, {"email": email}), ({"login": login}, {"age": 42})]
+            )
+            if not result.ok:
+                report(result.errors)
+        """
+        return bulk.bulk_update(self, items, chunk_size=chunk_size, append=append)
+
+    def load_and_insert(self, data, *, chunk_size=1000):
+        """Load the payloads of `data` and insert the valid ones by chunks of
+        `chunk_size` payloads: each chunk is loaded with one ``many=True``
+        load, and its documents are converted with ``to_mongo`` and written
+        with one unordered ``insert_many`` (instead of one ``save`` per
+        document).
+
+        As by ``save``, the documents are validated (including ``clean``)
+        before being written, the invalid ones being reported as errors.
+        Unlike ``save``, no signals are sent.
+
+        :return: A `BulkResult` reporting the validation and write errors
+            (e.g. duplicate keys) and the ids of the inserted documents by
+            position of the payloads
+
+        Example: ::
+
+            result = UserSchema().load_and_insert(rows, chunk_size=500)
+            print("%s users imported" % result.inserted_count)
+        """
+        return bulk.load_and_insert(self, data, chunk_size=chunk_size)
+
+    def bulk_upsert(self, data, *, key=None, chunk_size=1000):
+        """Create or update the documents of the payloads of `data`,
+        identified by their `key` field (default to the ``model_upsert_key``
+        option), by chunks of `chunk_size` payloads.
+
+        For each chunk, the existing documents are found with one ``$in``
+        query on the keys. The payloads of the existing documents are
+        written as updates (as `bulk_update`, the required fields being
+        ignored), the others are loaded as new documents (as
+        `load_and_insert`), and all are written with one unordered
+        ``bulk_write``. The references of the payloads are resolved once per
+        chunk. A payload whose key is repeated in its chunk is rejected.
+
+        As by ``save``, the new documents are validated (including
+        ``clean``) before being inserted. The updates are atomic, so as with
+        ``QuerySet.update`` the existing documents are not validated as a
+        whole. Unlike ``save``, no signals are sent.
+
+        The `key` field should have a unique index: a document inserted by
+        another process meanwhile is then reported as a write error.
+
+        :return: A `BulkResult` reporting the errors and the ids of the
+            inserted documents by position of the payloads
+
+        Example: ::
+
+            class UserSchema(ModelSchema):
+                class Meta:
+                    model = User
+                    model_upsert_key = "external_id"
+
+            result = UserSchema().bulk_upsert(records)
+        """
+        key = key or self.opts.model_upsert_key
+        if key is None:
+            raise ValueError("No key given to identify the documents")
+        return bulk.bulk_upsert(self, data, key, chunk_size=chunk_size)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Atomic update documents built from partial payloads, see
+`ModelSchema.get_update_spec`.
+"""
+
+from collections.abc import Mapping
+
+import mongoengine as me
+from marshmallow import ValidationError
+from marshmallow.exceptions import SCHEMA
+
+
+def get_update_spec(schema, data, append=()):
+    """
+    Load the payload `data` with `schema` and build the ``$set``/``$unset``/
+    ``$push`` update document of its fields, see `ModelSchema.get_update_spec`.
+    """
+    model = schema.opts.model
+    append = set(append)
+    unknown_append = append - set(schema.load_fields)
+    if unknown_append:
+        raise ValueError(
+            "Unknown fields to append: %s" % ", ".join(sorted(unknown_append))
+        )
+    if not isinstance(data, Mapping):
+        raise ValidationError({SCHEMA: [schema.error_messages["type"]]})
+    # The null values of the non nullable fields are unset (as mongoengine
+    # does on save) instead of being rejected by the loading
+    to_load = dict(data)
+    unset_fields = []
+    for field_name, field in schema.load_fields.items():
+        key = field.data_key if field.data_key is not None else field_name
+        if key in to_load and to_load[key] is None and not field.allow_none:
+            if field.required:
+                continue
+            del to_load[key]
+            unset_fields.append(field.attribute or field_name)
+    loaded_data = schema._do_load(
+        to_load, partial=schema._update_partial, postprocess=False
+    )
+    spec = {"$set": {}, "$unset": {}, "$push": {}}
+    for attr in unset_fields:
+        field_me = model._fields.get(attr)
+        if field_me is not None:
+            spec["$unset"][field_me.db_field] = ""
+    for field_name, field in schema.load_fields.items():
+        key = field.data_key if field.data_key is not None else field_name
+        attr = field.attribute or field_name
+        # Skip the default values added when loading
+        if key not in to_load or attr not in loaded_data:
+            continue
+        field_me = model._fields.get(attr)
+        if field_me is None:
+            # Not stored in the document
+            continue
+        if attr == model._meta.get("id_field"):
+            raise ValidationError("The primary key cannot be updated.", key)
+        value = loaded_data[attr]
+        if field_name in append:
+            if not isinstance(field_me, me.ListField):
+                raise ValueError("`%s` is not a list field" % field_name)
+            if value:
+                spec["$push"][field_me.db_field] = {"$each": field_me.to_mongo(value)}
+        elif value is None and not field_me.null:
+            spec["$unset"][field_me.db_field] = ""
+        else:
+            spec["$set"][field_me.db_field] = (
+                None if value is None else field_me.to_mongo(value)
+            )
+    return {operator: values for operator, values in spec.items() if values}
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental writing of dumped documents to binary file-like objects, see
+`ModelSchema.dump_to`.
+"""
+
+import gzip
+import json
+
+FORMATS = ("ndjson", "json")
+
+
+class BufferedWriter(object):
+    """Accumulate the written bytes and pass them to `fp` by chunks of at
+    least `buffer_size` bytes.
+    """
+
+    def __init__(self, fp, buffer_size=64 * 1024):
+        self.fp = fp
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.fp.write(bytes(self._buffer))
+            self._buffer.clear()
+
+
+def _encode(encoder, data):
+    # Encoders such as `orjson.dumps` directly return bytes
+    encoded = encoder(data)
+    if isinstance(encoded, str):
+        encoded = encoded.encode("utf-8")
+    return encoded
+
+
+def write_documents(
+    fp,
+    documents,
+    format="ndjson",
+    compress=False,
+    encoder=json.dumps,
+    buffer_size=64 * 1024,
+):
+    """
+    Write `documents` to the binary file-like object `fp` as they are
+    iterated.
+
+    :param documents: Iterable of dumped documents
+    :param format: ``ndjson`` (one JSON document per line) or ``json`` (JSON
+        array of the documents)
+    :param compress: If true, gzip the output
+    :param encoder: Function encoding a document to JSON (str or bytes)
+    :param buffer_size: Size (in bytes) of the chunks written to `fp`
+    :return: The number of written documents
+    """
+    if format not in FORMATS:
+        raise ValueError("format must be one of %s, not `%s`" % (FORMATS, format))
+    gzip_fp = gzip.GzipFile(fileobj=fp, mode="wb") if compress else None
+    writer = BufferedWriter(gzip_fp or fp, buffer_size=buffer_size)
+    count = 0
+    try:
+        if format == "json":
+            prefix, separator, suffix, end = b"[", b",", b"]", b""
+        else:
+            prefix, separator, suffix, end = b"", b"", b"", b"\n"
+        writer.write(prefix)
+        for document in documents:
+            if count:
+                writer.write(separator)
+            writer.write(_encode(encoder, document) + end)
+            count += 1
+        writer.write(suffix)
+        writer.flush()
+    finally:
+        if gzip_fp is not None:
+            # Only closes the gzip stream, not `fp`
+            gzip_fp.close()
+    return count
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from unittest import mock
+
+import bson
+import mongoengine as me
+import pytest
+
+from marshmallow_mongoengine import BulkResult, ModelSchema
+
+TEST_DB = "marshmallow_mongoengine-test"
+db = me.connect(TEST_DB)
+
+
+class BaseTest(object):
+    @classmethod
+    def setup_method(self, method):
+        # Reset database from previous test run
+        db.drop_database(TEST_DB)
+
+
+@pytest.fixture()
+def models():
+    class Author(me.Document):
+        name = me.StringField()
+
+    class Book(me.Document):
+        isbn = me.StringField(required=True, unique=True)
+        title = me.StringField(required=True, db_field="t")
+        pages = me.IntField(min_value=1)
+        author = me.ReferenceField(Author)
+        tags = me.ListField(me.StringField())
+
+    class _models(object):
+        def __init__(self):
+            self.Author = Author
+            self.Book = Book
+
+    return _models()
+
+
+@pytest.fixture()
+def schemas(models):
+    class BookSchema(ModelSchema):
+        class Meta:
+            model = models.Book
+
+    class _schemas(object):
+        def __init__(self):
+            self.BookSchema = BookSchema
+
+    return _schemas()
+
+
+class TestBulkUpdate(BaseTest):
+    def test_bulk_update(self, models, schemas):
+        books = [
+            models.Book(isbn="isbn-%s" % i, title="Book %s" % i, tags=["a"]).save()
+            for i in range(5)
+        ]
+        collection = models.Book._get_collection()
+        with mock.patch.object(
+            collection, "bulk_write", wraps=collection.bulk_write
+        ) as bulk_write:
+            result = schemas.BookSchema().bulk_update(
+                [
+                    (books[0].pk, {"pages": 10}),
+                    (books[1], {"title": "Other", "tags": ["b"]}),
+                    ({"isbn": "isbn-2"}, {"pages": 0}),
+                    ({"isbn": "isbn-3"}, {}),
+                    (str(books[4].pk), {"pages": 40}),
+                ],
+                chunk_size=2,
+                append=("tags",),
+            )
+        assert isinstance(result, BulkResult)
+        assert len(result) == 5
+        assert not result.ok
+        assert list(result.errors) == [2]
+        assert "pages" in result.errors[2]
+        assert result.succeeded == [0, 1, 3, 4]
+        assert result.matched_count == 3
+        assert result.modified_count == 3
+        # One write per chunk with updates
+        assert bulk_write.call_count == 2
+        pages = {book.isbn: book.pages for book in models.Book.objects}
+        assert pages == {
+            "isbn-0": 10,
+            "isbn-1": None,
+            "isbn-2": None,
+            "isbn-3": None,
+            "isbn-4": 40,
+        }
+        book = models.Book.objects.get(isbn="isbn-1")
+        assert book.title == "Other"
+        assert book.tags == ["a", "b"]
+
+    def test_bulk_update_write_errors(self, models, schemas):
+        models.Book.ensure_indexes()
+        models.Book(isbn="isbn-0", title="Book 0").save()
+        book = models.Book(isbn="isbn-1", title="Book 1").save()
+        result = schemas.BookSchema().bulk_update(
+            [(book.pk, {"isbn": "isbn-0"}), (book.pk, {"pages": 5})]
+        )
+        assert list(result.errors) == [0]
+        assert "_schema" in result.errors[0]
+        assert result.succeeded == [1]
+        book.reload()
+        assert book.isbn == "isbn-1"
+        assert book.pages == 5
+
+    def test_bulk_update_references(self, models, schemas):
+        author = models.Author(name="Jules").save()
+        books = [
+            models.Book(isbn="isbn-%s" % i, title="Book %s" % i).save()
+            for i in range(5)
+        ]
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "__iter__",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.__iter__,
+        ) as iter_mock:
+            result = schemas.BookSchema().bulk_update(
+                [(book.pk, {"author": str(author.pk)}) for book in books]
+            )
+        assert result.ok
+        # One query for the references of the whole chunk
+        assert iter_mock.call_count == 1
+        assert all(book.author == author for book in models.Book.objects)
+
+    def test_bulk_update_invalid_query(self, models, schemas):
+        book = models.Book(isbn="isbn-0", title="Book 0").save()
+        result = schemas.BookSchema().bulk_update(
+            [
+                ("not-an-oid", {"pages": 1}),
+                ({"unknown": 1}, {"pages": 2}),
+                (book.pk, {"pages": 3}),
+            ],
+            chunk_size=1,
+        )
+        assert sorted(result.errors) == [0, 1]
+        assert "_schema" in result.errors[0]
+        assert "_schema" in result.errors[1]
+        assert result.succeeded == [2]
+        book.reload()
+        assert book.pages == 3
+
+    def test_bulk_update_not_a_dict(self, models, schemas):
+        book = models.Book(isbn="isbn-0", title="Book 0").save()
+        result = schemas.BookSchema().bulk_update(
+            [
+                (book.pk, {"pages": 1}),
+                (book.pk, 5),
+                (book.pk, None),
+                (book.pk, "abc"),
+                (book.pk, [1, 2]),
+                (book.pk, {"title": "Other"}),
+            ],
+            chunk_size=2,
+        )
+        assert len(result) == 6
+        assert sorted(result.errors) == [1, 2, 3, 4]
+        for index in (1, 2, 3, 4):
+            assert result.errors[index] == {"_schema": ["Invalid input type."]}
+        assert result.succeeded == [0, 5]
+        assert result.matched_count == 2
+        book.reload()
+        assert book.pages == 1
+        assert book.title == "Other"
+
+
+class TestLoadAndInsert(BaseTest):
+    def test_load_and_insert(self, models, schemas):
+        models.Book.ensure_indexes()
+        author = models.Author(name="Jules").save()
+        models.Book(isbn="isbn-0", title="Existing").save()
+        data = [
+            {"isbn": "isbn-%s" % i, "title": "Book %s" % i, "author": str(author.pk)}
+            for i in range(1, 6)
+        ]
+        data[1]["pages"] = 0
+        data[3]["isbn"] = "isbn-0"
+        data.append({"isbn": "isbn-1", "title": "Duplicate"})
+        data.append({"isbn": "isbn-7"})
+        collection = models.Book._get_collection()
+        with mock.patch.object(
+            collection, "insert_many", wraps=collection.insert_many
+        ) as insert_many:
+            result = schemas.BookSchema().load_and_insert(data, chunk_size=3)
+        # No insert for the last chunk, without valid payload
+        assert insert_many.call_count == 2
+        assert len(result) == 7
+        assert sorted(result.errors) == [1, 3, 5, 6]
+        assert "pages" in result.errors[1]
+        # Duplicate keys
+        assert "_schema" in result.errors[3]
+        assert "_schema" in result.errors[5]
+        assert "title" in result.errors[6]
+        assert result.succeeded == [0, 2, 4]
+        assert result.inserted_count == 3
+        books = {book.isbn: book for book in models.Book.objects}
+        assert sorted(books) == ["isbn-0", "isbn-1", "isbn-3", "isbn-5"]
+        assert books["isbn-1"].title == "Book 1"
+        assert books["isbn-3"].author == author
+        assert result.ids[0] == books["isbn-1"].pk
+
+    def test_load_and_insert_invalid_payloads(self, models, schemas):
+        author = models.Author(name="Jules").save()
+        data = [
+            {"isbn": "isbn-%s" % i, "title": "Book %s" % i, "author": str(author.pk)}
+            for i in range(4)
+        ]
+        data[2]["pages"] = 0
+        schema = schemas.BookSchema()
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "__iter__",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.__iter__,
+        ) as iter_mock, mock.patch.object(
+            schema, "_do_load", wraps=schema._do_load
+        ) as do_load:
+            result = schema.load_and_insert(data)
+        # The valid payloads are not loaded again
+        assert do_load.call_count == 1
+        assert iter_mock.call_count == 1
+        assert list(result.errors) == [2]
+        assert result.inserted_count == 3
+        books = models.Book.objects.order_by("isbn")
+        assert [book.isbn for book in books] == ["isbn-0", "isbn-1", "isbn-3"]
+        assert all(book.author == author for book in books)
+
+    def test_load_and_insert_document_validation(self):
+        def check_isbn(value):
+            if not value.startswith("isbn-"):
+                raise me.ValidationError("Not an isbn")
+
+        class Book(me.Document):
+            isbn = me.StringField(validation=check_isbn)
+            title = me.StringField()
+
+            def clean(self):
+                if self.title == "Draft":
+                    raise me.ValidationError("Drafts cannot be published")
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = Book
+
+        result = BookSchema().load_and_insert(
+            [
+                {"isbn": "isbn-0", "title": "Book 0"},
+                {"isbn": "0", "title": "Book 1"},
+                {"isbn": "isbn-2", "title": "Draft"},
+            ]
+        )
+        assert result.errors == {
+            1: {"isbn": ["Not an isbn"]},
+            2: {"_schema": ["Drafts cannot be published"]},
+        }
+        assert result.succeeded == [0]
+        assert result.inserted_count == 1
+        assert [book.isbn for book in Book.objects] == ["isbn-0"]
+
+
+class TestBulkUpsert(BaseTest):
+    def test_bulk_upsert(self, models, schemas):
+        models.Book.ensure_indexes()
+        existing = models.Book(isbn="isbn-0", title="Book 0", pages=10).save()
+        models.Book(isbn="isbn-1", title="Book 1").save()
+        data = [
+            {"isbn": "isbn-0", "pages": 20},
+            {"isbn": "isbn-2", "title": "Book 2"},
+            {"isbn": "isbn-1", "pages": 0},
+            {"isbn": "isbn-3"},
+            {"isbn": "isbn-2", "title": "Duplicate"},
+            {"title": "No key"},
+        ]
+        collection = models.Book._get_collection()
+        with mock.patch.object(
+            collection, "find", wraps=collection.find
+        ) as find, mock.patch.object(
+            collection, "bulk_write", wraps=collection.bulk_write
+        ) as bulk_write:
+            result = schemas.BookSchema().bulk_upsert(data, key="isbn")
+        assert find.call_count == 1
+        assert bulk_write.call_count == 1
+        assert len(result) == 6
+        assert sorted(result.errors) == [2, 3, 4, 5]
+        assert "pages" in result.errors[2]
+        # Created documents are loaded with their required fields
+        assert "title" in result.errors[3]
+        assert "isbn" in result.errors[4]
+        assert "isbn" in result.errors[5]
+        assert result.succeeded == [0, 1]
+        assert result.matched_count == 1
+        assert result.inserted_count == 1
+        books = {book.isbn: book for book in models.Book.objects}
+        assert sorted(books) == ["isbn-0", "isbn-1", "isbn-2"]
+        assert books["isbn-0"].pk == existing.pk
+        assert books["isbn-0"].pages == 20
+        assert books["isbn-0"].title == "Book 0"
+        assert books["isbn-2"].title == "Book 2"
+        assert result.ids == {1: books["isbn-2"].pk}
+
+    def test_upsert_key_option(self, models, schemas):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+                model_upsert_key = "isbn"
+
+        models.Book(isbn="isbn-0", title="Book 0").save()
+        result = BookSchema().bulk_upsert(
+            [{"isbn": "isbn-0", "title": "Other"}, {"isbn": "isbn-1", "title": "New"}],
+            chunk_size=1,
+        )
+        assert result.ok
+        titles = {book.isbn: book.title for book in models.Book.objects}
+        assert titles == {"isbn-0": "Other", "isbn-1": "New"}
+        with pytest.raises(ValueError):
+            schemas.BookSchema().bulk_upsert([])
+        with pytest.raises(ValueError):
+            BookSchema().bulk_upsert([], key="unknown")
+
+    def test_bulk_upsert_by_id(self, models, schemas):
+        book = models.Book(isbn="isbn-0", title="Book 0").save()
+        new_id = str(bson.ObjectId())
+        result = schemas.BookSchema().bulk_upsert(
+            [
+                {"id": str(book.pk), "pages": 10},
+                {"id": new_id, "isbn": "isbn-1", "title": "Book 1"},
+                ["not", "a", "payload"],
+            ],
+            key="id",
+        )
+        assert list(result.errors) == [2]
+        assert result.errors[2] == {"_schema": ["Invalid input type."]}
+        assert result.succeeded == [0, 1]
+        book.reload()
+        assert book.pages == 10
+        assert models.Book.objects.get(pk=new_id).title == "Book 1"
+
+    def test_bulk_upsert_references(self, models, schemas):
+        author = models.Author(name="Jules").save()
+        for i in range(3):
+            models.Book(isbn="isbn-%s" % i, title="Book %s" % i).save()
+        data = [
+            {"isbn": "isbn-%s" % i, "title": "Book %s" % i, "author": str(author.pk)}
+            for i in range(6)
+        ]
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "__iter__",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.__iter__,
+        ) as iter_mock:
+            result = schemas.BookSchema().bulk_upsert(data, key="isbn")
+        assert result.ok
+        # One query for the references of the whole chunk
+        assert iter_mock.call_count == 1
+        assert all(book.author == author for book in models.Book.objects)
+        assert models.Book.objects.count() == 6
+
+    def test_bulk_upsert_document_validation(self):
+        class Book(me.Document):
+            isbn = me.StringField(unique=True)
+            title = me.StringField()
+
+            def clean(self):
+                if self.title == "Draft":
+                    raise me.ValidationError("Drafts cannot be published")
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = Book
+
+        result = BookSchema().bulk_upsert(
+            [
+                {"isbn": "isbn-0", "title": "Book 0"},
+                {"isbn": "isbn-1", "title": "Draft"},
+            ],
+            key="isbn",
+        )
+        assert result.errors == {1: {"_schema": ["Drafts cannot be published"]}}
+        assert result.succeeded == [0]
+        assert [book.isbn for book in Book.objects] == ["isbn-0"]
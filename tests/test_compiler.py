@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import datetime as dt
+import json
+
+import mongoengine as me
+import pytest
+from marshmallow import fields as ma_fields
+
+from marshmallow_mongoengine import ModelSchema, fields
+
+TEST_DB = "marshmallow_mongoengine-test"
+db = me.connect(TEST_DB)
+
+
+class BaseTest(object):
+    @classmethod
+    def setup_method(self, method):
+        # Reset database from previous test run
+        db.drop_database(TEST_DB)
+
+
+@pytest.fixture()
+def models():
+    class Author(me.Document):
+        name = me.StringField()
+
+    class Comment(me.EmbeddedDocument):
+        text = me.StringField()
+        author = me.ReferenceField(Author)
+        replies = me.ListField(me.EmbeddedDocumentField("Comment"))
+
+    class Article(me.Document):
+        title = me.StringField(required=True)
+        views = me.IntField(default=0)
+        rating = me.FloatField()
+        published = me.BooleanField()
+        created = me.DateTimeField()
+        location = me.PointField()
+        author = me.ReferenceField(Author)
+        tags = me.ListField(me.StringField())
+        scores = me.ListField(me.ListField(me.IntField()))
+        comments = me.ListField(me.EmbeddedDocumentField(Comment))
+        extra = me.DictField()
+
+    class _models(object):
+        def __init__(self):
+            self.Author = Author
+            self.Comment = Comment
+            self.Article = Article
+
+    return _models()
+
+
+@pytest.fixture()
+def articles(models):
+    author = models.Author(name="Jules").save()
+    return [
+        models.Article(
+            title="Around the World",
+            views=12,
+            rating=4.5,
+            published=True,
+            created=dt.datetime(2020, 1, 2, 3, 4, 5),
+            location=[2.35, 48.85],
+            author=author,
+            tags=["travel", "novel"],
+            scores=[[1, 2], []],
+            comments=[
+                models.Comment(
+                    text="Great",
+                    author=author,
+                    replies=[models.Comment(text="Indeed")],
+                )
+            ],
+            extra={"isbn": "123"},
+        ).save(),
+        models.Article(title="Draft", tags=[], extra={}).save(),
+    ]
+
+
+class TestCompile(BaseTest):
+    def test_same_output(self, models, articles):
+        class ArticleSchema(ModelSchema):
+            summary = fields.Function(lambda obj: obj.title[:6])
+            headline = fields.String(attribute="title", data_key="head", dump_only=True)
+
+            class Meta:
+                model = models.Article
+
+        class CompiledArticleSchema(ArticleSchema):
+            class Meta(ArticleSchema.Meta):
+                model_compile = True
+
+        schema, compiled_schema = ArticleSchema(), CompiledArticleSchema()
+        assert not schema._compiled_dump
+        assert compiled_schema._compiled_dump
+        articles = list(models.Article.objects.order_by("title"))
+        expected = schema.dump(articles, many=True)
+        # Same values in the same order
+        assert json.dumps(compiled_schema.dump(articles, many=True)) == json.dumps(
+            expected
+        )
+        assert compiled_schema.dump(articles[0]) == expected[0]
+        assert expected[0]["location"] == {"x": 2.35, "y": 48.85}
+        assert expected[0]["comments"][0]["replies"] == [{"text": "Indeed"}]
+        assert expected[1] == {
+            "id": str(articles[1].pk),
+            "title": "Draft",
+            "views": 0,
+            "summary": "Draft",
+            "head": "Draft",
+        }
+        # Nested schemas are compiled on first use
+        nested_schema = compiled_schema.fields["comments"].inner.schema
+        assert nested_schema._compiled_dump
+
+    def test_fallback(self, models, articles):
+        class ArticleSchema(ModelSchema):
+            class Meta:
+                model = models.Article
+                fields = ("title", "views")
+
+        schema = ArticleSchema()
+        assert schema.compile()
+        # Only Mongoengine documents are dumped by the compiled function
+        assert schema.dump({"title": "Draft", "views": None}) == {"title": "Draft"}
+
+        class CustomArticleSchema(ArticleSchema):
+            def get_attribute(self, obj, attr, default):
+                if attr == "title":
+                    return "custom"
+                return super(CustomArticleSchema, self).get_attribute(
+                    obj, attr, default
+                )
+
+        schema = CustomArticleSchema()
+        assert not schema.compile()
+        assert schema.dump(articles[0]) == {"title": "custom", "views": 12}
+
+    def test_custom_get_value(self, models, articles):
+        class UpperString(ma_fields.String):
+            def get_value(self, obj, attr, accessor=None, default=ma_fields.missing_):
+                value = super(UpperString, self).get_value(
+                    obj, attr, accessor=accessor, default=default
+                )
+                return value.upper() if isinstance(value, str) else value
+
+        class ArticleSchema(ModelSchema):
+            title = UpperString()
+
+            class Meta:
+                model = models.Article
+                fields = ("title",)
+
+        schema = ArticleSchema()
+        expected = schema.dump(articles[0])
+        assert expected == {"title": "AROUND THE WORLD"}
+        assert schema.compile()
+        assert schema.dump(articles[0]) == expected
@@ -90,6 +90,53 @@ class TestFields(BaseTest):
         for i, elem in enumerate(list_):
             assert load_data.list[i].field == elem["field"]
 
+    def test_EmbeddedDocumentField_shared_schema(self):
+        class Address(me.EmbeddedDocument):
+            city = me.StringField()
+
+        class User(me.Document):
+            address = me.EmbeddedDocumentField(Address)
+
+        class Company(me.Document):
+            addresses = me.ListField(me.EmbeddedDocumentField(Address))
+
+        user_schema_cls = type(fields_for_model(User)["address"].schema)
+        company_schema_cls = type(fields_for_model(Company)["addresses"].inner.schema)
+        assert user_schema_cls is company_schema_cls
+        assert user_schema_cls.opts.model is Address
+
+    def test_EmbeddedDocumentField_recursive(self):
+        class Node(me.EmbeddedDocument):
+            name = me.StringField()
+            children = me.ListField(me.EmbeddedDocumentField("Node"))
+
+        class Tree(me.Document):
+            root = me.EmbeddedDocumentField(Node)
+
+        class TreeSchema(ModelSchema):
+            class Meta:
+                model = Tree
+
+        tree = Tree(
+            root=Node(
+                name="a",
+                children=[Node(name="b", children=[Node(name="c")]), Node(name="d")],
+            )
+        ).save()
+        dump_data = TreeSchema().dump(tree)
+        assert dump_data == {
+            "id": str(tree.id),
+            "root": {
+                "name": "a",
+                "children": [
+                    {"name": "b", "children": [{"name": "c"}]},
+                    {"name": "d"},
+                ],
+            },
+        }
+        load_data = TreeSchema().load(dump_data)
+        assert load_data.root.children[0].children[0].name == "c"
+
     @exception_test
     def test_DictField(self):
         class Doc(me.Document):
@@ -304,7 +351,90 @@ class TestFields(BaseTest):
         doc.save()
         dump_data = DocSchema().dump(doc)
         assert dump_data == {"embedded": {"field_b": 42}, "id": "main"}
-        # TODO: test load ?
+
+        # Without the class name, the embedded document is ignored on load
+        load_data = DocSchema().load(dump_data)
+        assert load_data.id == "main"
+        assert load_data.embedded is None
+        load_data = DocSchema().load({"embedded": {"field_b": 42}})
+        assert load_data.embedded is None
+
+        # Test load, the class name is needed
+        class DocClsSchema(ModelSchema):
+            embedded = fields.GenericEmbeddedDocument(include_cls=True)
+
+            class Meta:
+                model = Doc
+
+        dump_data = DocClsSchema().dump(doc)
+        assert dump_data == {
+            "embedded": {"field_b": 42, "_cls": "EmbeddedB"},
+            "id": "main",
+        }
+        load_data = DocSchema().load(dump_data)
+        assert isinstance(load_data.embedded, EmbeddedB)
+        assert load_data.embedded.field_b == 42
+        for bad_embedded in (
+            {"_cls": "not_a_class"},
+            {"_cls": "Doc"},
+            {"_cls": "EmbeddedB", "field_b": "not_an_int"},
+        ):
+            with pytest.raises(ValidationError) as excinfo:
+                DocSchema().load({"embedded": bad_embedded})
+            assert "embedded" in excinfo.value.args[0]
+
+    def test_GenericEmbeddedDocumentField_list(self):
+        class EmbeddedA(me.EmbeddedDocument):
+            field_a = me.StringField()
+
+        class EmbeddedB(me.EmbeddedDocument):
+            field_b = me.IntField()
+
+        class EmbeddedC(me.EmbeddedDocument):
+            field_c = me.IntField()
+
+        class Doc(me.Document):
+            embedded = me.ListField(
+                me.GenericEmbeddedDocumentField(choices=[EmbeddedA, EmbeddedB])
+            )
+
+        class DocSchema(ModelSchema):
+            class Meta:
+                model = Doc
+
+        field = DocSchema().fields["embedded"].inner
+        assert field.document_class_choices == ["EmbeddedA", "EmbeddedB"]
+
+        class DocClsSchema(ModelSchema):
+            embedded = fields.List(
+                fields.GenericEmbeddedDocument(
+                    choices=[EmbeddedA, EmbeddedB], include_cls=True
+                )
+            )
+
+            class Meta:
+                model = Doc
+
+        schema = DocClsSchema()
+        field = schema.fields["embedded"].inner
+        doc = Doc(embedded=[EmbeddedA(field_a=str(i)) for i in range(3)])
+        doc.embedded.append(EmbeddedB(field_b=42))
+        dump_data = schema.dump(doc)
+        assert dump_data["embedded"][-1] == {"field_b": 42, "_cls": "EmbeddedB"}
+        # One schema per embedded document class
+        assert list(field._schemas) == [EmbeddedA, EmbeddedB]
+        load_data = schema.load(dump_data)
+        assert load_data.embedded == doc.embedded
+        with pytest.raises(ValidationError) as excinfo:
+            schema.load({"embedded": [{"_cls": "EmbeddedC", "field_c": 1}]})
+        assert excinfo.value.args[0] == {
+            "embedded": {
+                0: [
+                    "Invalid _cls field `EmbeddedC`, must be one of "
+                    "['EmbeddedA', 'EmbeddedB']"
+                ]
+            }
+        }
 
     @exception_test
     def test_MapField(self):
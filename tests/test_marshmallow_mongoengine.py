@@ -2,15 +2,40 @@
 from __future__ import absolute_import
 
 import datetime as dt
+import gzip
+import io
+import json
+import uuid
 from datetime import datetime
+from decimal import Decimal
+from unittest import mock
 
+import bson
+from bson.decimal128 import Decimal128
+from bson.raw_bson import RawBSONDocument
+import marshmallow as ma
 import mongoengine as me
 from marshmallow import validate
 from marshmallow.exceptions import ValidationError
 import pytest
 
 from . import exception_test
-from marshmallow_mongoengine import ModelSchema, field_for, fields, fields_for_model
+from marshmallow_mongoengine import (
+    ModelConversionError,
+    ModelConverter,
+    ModelSchema,
+    convert_field,
+    field_for,
+    fields,
+    fields_for_model,
+    register_field,
+)
+from marshmallow_mongoengine import native
+from marshmallow_mongoengine.conversion.fields import (
+    FIELD_MAPPING,
+    get_field_builder_cls,
+    register_field_builder,
+)
 
 TEST_DB = "marshmallow_mongoengine-test"
 db = me.connect(TEST_DB)
@@ -30,6 +55,13 @@ def contains_validator(field, v_type):
     return False
 
 
+def unregister_field(mongo_field_cls):
+    """Remove a field registered by a test from the global mapping"""
+    FIELD_MAPPING.pop(mongo_field_cls, None)
+    # Re-register a builder to invalidate the conversion caches
+    register_field_builder(me.fields.StringField, FIELD_MAPPING[me.fields.StringField])
+
+
 class AnotherIntegerField(me.IntField):
 
     """Use me to test if MRO works like we want"""
@@ -179,6 +211,59 @@ class TestModelFieldConversion(BaseTest):
         course_fields = fields_for_model(models.Course)
         assert type(course_fields["id"]) is fields.Int
 
+    def test_fields_for_model_cache(self, models):
+        ModelConverter.clear_cache()
+        fields_ = fields_for_model(models.Student)
+        assert ModelConverter.cache_info() == (0, 1, 1)
+        cached_fields = fields_for_model(models.Student)
+        assert ModelConverter.cache_info() == (1, 1, 1)
+        assert cached_fields.keys() == fields_.keys()
+        assert cached_fields["full_name"] is not fields_["full_name"]
+        fields_for_model(models.Student, fields=("full_name",))
+        assert ModelConverter.cache_info() == (1, 2, 2)
+
+        class StudentSchema(ModelSchema):
+            class Meta:
+                model = models.Student
+
+        class ChildStudentSchema(StudentSchema):
+            pass
+
+        assert ModelConverter.cache_info() == (3, 2, 2)
+
+        # Registering a field invalidates the cache
+        class CustomField(me.StringField):
+            pass
+
+        register_field(CustomField, fields.Raw)
+        try:
+            fields_for_model(models.Student)
+            assert ModelConverter.cache_info() == (3, 3, 1)
+        finally:
+            unregister_field(CustomField)
+
+    def test_field_builder_dispatch(self):
+        class CustomField(me.StringField):
+            pass
+
+        class SubCustomField(CustomField):
+            pass
+
+        assert get_field_builder_cls(SubCustomField) is get_field_builder_cls(
+            me.StringField
+        )
+        assert type(convert_field(SubCustomField())) is fields.String
+        # Registering a field updates the builders resolved for its subclasses
+        register_field(CustomField, fields.Raw)
+        try:
+            assert type(convert_field(SubCustomField())) is fields.Raw
+            assert convert_field(SubCustomField(), instance=False) is fields.Raw
+        finally:
+            unregister_field(CustomField)
+        assert type(convert_field(SubCustomField())) is fields.String
+        with pytest.raises(ModelConversionError):
+            convert_field(me.fields.BaseField())
+
 
 class TestFieldFor(BaseTest):
     def test_field_for(self, models):
@@ -237,6 +322,97 @@ class TestModelSchema(BaseTest):
         # Make sure default values doesn't mess
         assert student.full_name == full_name
 
+    def test_update_required(self):
+        class Book(me.Document):
+            title = me.StringField(required=True)
+            isbn = me.StringField(required=True)
+            pages = me.IntField()
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = Book
+
+        book = Book(title="Around the World", isbn="978-0").save()
+        schema = BookSchema()
+
+        def check_do_load(*args, **kwargs):
+            # Concurrent loads still see the required fields
+            assert schema.fields["title"].required
+            return ma.Schema._do_load(schema, *args, **kwargs)
+
+        with mock.patch.object(schema, "_do_load", side_effect=check_do_load):
+            assert schema.update(book, {"pages": 42}) is book
+        assert book.pages == 42
+        assert book.title == "Around the World"
+        with pytest.raises(ma.ValidationError) as excinfo:
+            schema.load({"pages": 42})
+        assert set(excinfo.value.messages) == {"title", "isbn"}
+
+    def test_update_spec(self):
+        class Author(me.Document):
+            name = me.StringField()
+
+        class Edition(me.EmbeddedDocument):
+            year = me.IntField(db_field="y")
+
+        class Book(me.Document):
+            title = me.StringField(required=True, db_field="t")
+            pages = me.IntField(default=100)
+            summary = me.StringField()
+            published = me.DateTimeField()
+            author = me.ReferenceField(Author)
+            tags = me.ListField(me.StringField())
+            editions = me.ListField(me.EmbeddedDocumentField(Edition))
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = Book
+
+        author = Author(name="Jules").save()
+        book = Book(title="Around the World", summary="...", tags=["a"]).save()
+        schema = BookSchema()
+        spec = schema.get_update_spec(
+            {
+                "published": "1872-12-22T00:00:00",
+                "author": str(author.pk),
+                "summary": None,
+                "tags": ["b", "c"],
+                "editions": [{"year": 1872}],
+            },
+            append=("tags",),
+        )
+        assert spec == {
+            "$set": {
+                "published": datetime(1872, 12, 22),
+                "author": author.pk,
+                "editions": [{"y": 1872}],
+            },
+            "$unset": {"summary": ""},
+            "$push": {"tags": {"$each": ["b", "c"]}},
+        }
+        Book._get_collection().update_one({"_id": book.pk}, spec)
+        book.reload()
+        assert book.title == "Around the World"
+        assert book.pages == 100
+        assert book.summary is None
+        assert book.author == author
+        assert book.tags == ["a", "b", "c"]
+        assert book.editions[0].year == 1872
+        assert schema.get_update_spec({"title": "Journey"}) == {
+            "$set": {"t": "Journey"}
+        }
+        assert schema.get_update_spec({}) == {}
+        with pytest.raises(ma.ValidationError):
+            schema.get_update_spec({"pages": "many"})
+        with pytest.raises(ma.ValidationError):
+            schema.get_update_spec({"id": str(book.pk)})
+        for not_a_dict in (5, None, "abc", [1, 2]):
+            with pytest.raises(ma.ValidationError) as excinfo:
+                schema.get_update_spec(not_a_dict)
+            assert excinfo.value.messages == {"_schema": ["Invalid input type."]}
+        with pytest.raises(ValueError):
+            schema.get_update_spec({"title": "Journey"}, append=("title",))
+
     def test_model_schema_dumping(self, schemas, student):
         schema = schemas.StudentSchema()
         result = schema.dump(student)
@@ -446,6 +622,384 @@ class TestModelSchema(BaseTest):
         assert dump_data["age"] == "child-custom-" + str(student.age)
         assert dump_data["custom_field"] == "custom-field"
 
+    def test_defer_conversion(self, student, models):
+        with mock.patch.object(
+            ModelConverter,
+            "fields_for_model",
+            autospec=True,
+            side_effect=ModelConverter.fields_for_model,
+        ) as convert_mock:
+
+            class StudentSchema(ModelSchema):
+                full_name = field_for(
+                    models.Student, "full_name", defer=True, dump_only=True
+                )
+
+                class Meta:
+                    model = models.Student
+                    model_defer_conversion = True
+
+            assert convert_mock.call_count == 0
+
+            class ChildStudentSchema(StudentSchema):
+                class Meta(StudentSchema.Meta):
+                    fields = ("full_name", "age")
+
+            # Subclassing a schema requires its fields
+            assert convert_mock.call_count == 1
+            assert "age" in StudentSchema._declared_fields
+            schema = ChildStudentSchema()
+            assert convert_mock.call_count == 2
+            ChildStudentSchema()
+            assert convert_mock.call_count == 2
+
+        assert type(schema.fields["full_name"]) is fields.String
+        assert schema.fields["full_name"].dump_only
+        assert schema.dump(student) == {"full_name": "Monty Python", "age": 10}
+        assert schema.load({"age": 12}).age == 12
+
+    def test_dump_raw(self):
+        class Author(me.Document):
+            name = me.StringField(db_field="n")
+
+        class Address(me.EmbeddedDocument):
+            city = me.StringField(db_field="c")
+            location = me.PointField(db_field="l")
+
+        class Extra(me.EmbeddedDocument):
+            price = me.DecimalField(precision=2)
+
+        class Book(me.Document):
+            title = me.StringField(db_field="t")
+            author = me.ReferenceField(Author, db_field="a")
+            coauthors = me.ListField(me.ReferenceField(Author, dbref=True))
+            addresses = me.ListField(me.EmbeddedDocumentField(Address))
+            extra = me.GenericEmbeddedDocumentField()
+            edited = me.ComplexDateTimeField()
+            revisions = me.ListField(me.ComplexDateTimeField())
+            sorted_revisions = me.SortedListField(me.ComplexDateTimeField())
+            prices = me.MapField(me.DecimalField(precision=2))
+            codes = me.ListField(me.ListField(me.UUIDField(binary=False)))
+            route = me.LineStringField()
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = Book
+
+        author = Author(name="Jules").save()
+        Book(
+            title="Around the World",
+            author=author,
+            coauthors=[author],
+            addresses=[Address(city="Paris", location=[2.35, 48.85])],
+            extra=Extra(price="12.50"),
+            edited=datetime(2020, 1, 2, 3, 4, 5, 6),
+            revisions=[datetime(2020, 1, 1), datetime(2020, 1, 2, 3, 4, 5, 6)],
+            sorted_revisions=[datetime(2020, 1, 2), datetime(2020, 1, 1)],
+            prices={"paper": Decimal("12.50"), "ebook": Decimal("5")},
+            codes=[[uuid.UUID(int=1), uuid.UUID(int=2)]],
+            route=[[1, 2], [3, 4]],
+        ).save()
+        Book(title="Draft").save()
+        schema = BookSchema()
+        expected = schema.dump(Book.objects.order_by("t"), many=True)
+        raw_books = list(Book.objects.order_by("t").as_pymongo())
+        assert "_id" in raw_books[0] and "t" in raw_books[0]
+        assert schema.dump_raw(raw_books, many=True) == expected
+        assert schema.dump_raw(raw_books[0]) == expected[0]
+        assert expected[0]["addresses"] == [
+            {"city": "Paris", "location": {"x": 2.35, "y": 48.85}}
+        ]
+        assert expected[0]["extra"] == {"price": Decimal("12.50")}
+        assert expected[0]["revisions"][1] == "2020-01-02T03:04:05.000006"
+        assert expected[0]["prices"] == {
+            "paper": Decimal("12.50"),
+            "ebook": Decimal("5.00"),
+        }
+        # Outside of dump_raw, dicts are still read by attribute name
+        assert schema.dump({"title": "Draft"}) == {"title": "Draft"}
+
+    def test_iter_dump(self):
+        class Author(me.Document):
+            name = me.StringField()
+
+        class Book(me.Document):
+            title = me.StringField()
+            author = me.ReferenceField(Author)
+
+        class BookSchema(ModelSchema):
+            author = fields.Reference(Author, populate=True)
+
+            class Meta:
+                model = Book
+                fields = ("title", "author")
+
+            @ma.post_dump(pass_many=True)
+            def count_dumps(self, data, many, **kwargs):
+                self.dumps_count += 1
+                return data
+
+        authors = [Author(name=str(i)).save() for i in range(3)]
+        for i in range(7):
+            Book(title=str(i), author=authors[i % 3]).save()
+        schema = BookSchema()
+        schema.dumps_count = 0
+        books = Book.objects.order_by("title")
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "__iter__",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.__iter__,
+        ) as iter_mock:
+            dumped = schema.iter_dump(books, batch_size=3)
+            first = next(dumped)
+            # Authors of the first batch fetched at once
+            assert iter_mock.call_count == 1
+            assert first == {
+                "title": "0",
+                "author": {"id": str(authors[0].pk), "name": "0"},
+            }
+            dumped = [first] + list(dumped)
+        # The queryset is not cached
+        assert books._result_cache is None
+        assert schema.dumps_count == 3
+        assert dumped == schema.dump(books, many=True)
+
+        chunks = list(schema.iter_dump(list(books), batch_size=3, chunks=True))
+        assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+        raw_chunks = schema.iter_dump(
+            books.as_pymongo(), batch_size=5, chunks=True, raw=True
+        )
+        assert list(raw_chunks) == [
+            chunks[0] + chunks[1][:2],
+            chunks[1][2:] + chunks[2],
+        ]
+
+    def test_dump_to(self):
+        class Book(me.Document):
+            title = me.StringField()
+            tags = me.ListField(me.StringField())
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = Book
+                fields = ("title", "tags")
+
+        for i in range(5):
+            Book(title="Book %s" % i, tags=["é"] * i).save()
+        schema = BookSchema()
+        expected = schema.dump(Book.objects.order_by("title"), many=True)
+
+        fp = io.BytesIO()
+        count = schema.dump_to(fp, Book.objects.order_by("title"), batch_size=2)
+        assert count == 5
+        lines = fp.getvalue().decode("utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == expected
+
+        fp = io.BytesIO()
+        schema.dump_to(
+            fp,
+            Book.objects.order_by("title"),
+            format="json",
+            compress=True,
+            encoder=lambda data: json.dumps(data, ensure_ascii=False),
+            buffer_size=10,
+        )
+        assert json.loads(gzip.decompress(fp.getvalue())) == expected
+
+        fp = io.BytesIO()
+        assert schema.dump_to(fp, [], format="json") == 0
+        assert fp.getvalue() == b"[]"
+        with pytest.raises(ValueError):
+            schema.dump_to(fp, [], format="xml")
+
+    def test_projection(self):
+        class Address(me.EmbeddedDocument):
+            city = me.StringField(db_field="c")
+            zip_code = me.StringField()
+
+        class Node(me.EmbeddedDocument):
+            name = me.StringField()
+            children = me.ListField(me.EmbeddedDocumentField("Node"))
+
+        class User(me.Document):
+            name = me.StringField(db_field="n")
+            email = me.StringField()
+            avatar = me.FileField()
+            history = me.ListField(me.IntField())
+            addresses = me.ListField(me.EmbeddedDocumentField(Address))
+            tree = me.EmbeddedDocumentField(Node)
+
+        class UserSchema(ModelSchema):
+            class Meta:
+                model = User
+
+        assert sorted(UserSchema().get_projection()) == [
+            "addresses.city",
+            "addresses.zip_code",
+            "email",
+            "history",
+            "id",
+            "name",
+            "tree.children",
+            "tree.name",
+        ]
+        projection = UserSchema(exclude=("history", "tree")).get_projection(
+            db_field=True
+        )
+        assert sorted(projection) == [
+            "_id",
+            "addresses.c",
+            "addresses.zip_code",
+            "email",
+            "n",
+        ]
+
+        class UserWithFunctionSchema(UserSchema):
+            initials = fields.Function(lambda user: user.name[:1])
+
+        assert UserWithFunctionSchema().get_projection() is None
+
+        User(
+            name="John",
+            email="john@example.com",
+            history=list(range(100)),
+            addresses=[Address(city="Paris", zip_code="75001")],
+        ).save()
+        schema = UserSchema(only=("name", "addresses.city"))
+        with mock.patch.object(
+            me.queryset.QuerySet, "only", autospec=True, side_effect=me.QuerySet.only
+        ) as only_mock:
+            dumped = schema.dump_queryset(User.objects)
+        assert only_mock.call_args[0][1:] == ("name", "addresses.city")
+        assert dumped == [{"name": "John", "addresses": [{"city": "Paris"}]}]
+
+    def test_dump_bson(self):
+        class Author(me.Document):
+            name = me.StringField()
+
+        class Edition(me.EmbeddedDocument):
+            published = me.DateField()
+            price = me.DecimalField(precision=2)
+
+        class Book(me.Document):
+            title = me.StringField()
+            uuid = me.UUIDField()
+            created = me.DateTimeField()
+            author = me.ReferenceField(Author)
+            coauthors = me.ListField(me.ReferenceField(Author))
+            editions = me.ListField(me.EmbeddedDocumentField(Edition))
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = Book
+
+        author = Author(name="Jules").save()
+        book = Book(
+            id=bson.ObjectId(),
+            title="Around the World",
+            uuid=uuid.UUID("12345678123456781234567812345678"),
+            created=datetime(2020, 1, 2, 3, 4, 5),
+            author=author,
+            coauthors=[author],
+            editions=[Edition(published=dt.date(1872, 12, 22), price="12.50")],
+        )
+        expected = {
+            "id": book.pk,
+            "title": "Around the World",
+            "uuid": book.uuid,
+            "created": datetime(2020, 1, 2, 3, 4, 5),
+            "author": author.pk,
+            "coauthors": [author.pk],
+            "editions": [
+                {
+                    "published": datetime(1872, 12, 22),
+                    "price": Decimal128("12.50"),
+                }
+            ],
+        }
+        schema = BookSchema()
+        assert schema.dump_native(book) == expected
+        encoded = schema.dump_bson(book)
+        assert isinstance(encoded, bytes)
+        assert bson.decode(encoded, codec_options=native.CODEC_OPTIONS) == expected
+        documents = schema.dump_bson([book], many=True, as_document=True)
+        assert isinstance(documents[0], RawBSONDocument)
+        assert documents[0]["author"] == author.pk
+        # Regular dumps are unchanged
+        assert schema.dump(book)["author"] == str(author.pk)
+
+    def test_load_bson(self):
+        class Author(me.Document):
+            name = me.StringField()
+
+        class Edition(me.EmbeddedDocument):
+            published = me.DateField()
+            price = me.DecimalField(precision=2)
+
+        class Book(me.Document):
+            title = me.StringField(required=True)
+            created = me.DateTimeField()
+            author = me.ReferenceField(Author)
+            editions = me.ListField(me.EmbeddedDocumentField(Edition))
+            summary = me.StringField()
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = Book
+
+        author = Author(name="Jules").save()
+        book = Book(
+            title="Around the World",
+            created=datetime(2020, 1, 2, 3, 4, 5),
+            author=author,
+            editions=[Edition(published=dt.date(1872, 12, 22), price="12.50")],
+            summary="x" * 1000,
+        )
+        schema = BookSchema()
+        encoded = schema.dump_bson(book)
+        # The datetimes are loaded without being formatted and parsed back
+        with mock.patch.object(
+            ma.fields.DateTime, "_serialize", side_effect=AssertionError
+        ), mock.patch.object(
+            ma.fields.DateTime, "_make_object_from_format", side_effect=AssertionError
+        ):
+            loaded = schema.load_bson(encoded)
+        assert isinstance(loaded, Book)
+        assert loaded.title == "Around the World"
+        assert loaded.created == datetime(2020, 1, 2, 3, 4, 5)
+        assert loaded.author == author
+        assert loaded.editions[0].published == dt.date(1872, 12, 22)
+        assert loaded.editions[0].price == Decimal("12.50")
+        loaded = schema.load_bson(
+            [RawBSONDocument(encoded)] * 2, many=True, partial=True
+        )
+        assert [item.title for item in loaded] == ["Around the World"] * 2
+        # Only the values of the loaded fields are decoded
+        with mock.patch.object(
+            native, "decode_element", wraps=native.decode_element
+        ) as decode_element:
+            loaded = BookSchema(only=("title",)).load_bson(encoded, unknown=ma.EXCLUDE)
+        assert loaded.title == "Around the World"
+        assert [call.args[1] for call in decode_element.call_args_list] == ["title"]
+        with pytest.raises(ma.ValidationError) as excinfo:
+            BookSchema(only=("title",)).load_bson(encoded)
+        assert excinfo.value.messages["summary"] == ["Unknown field."]
+
+        # The datetimes are loaded with the format of the fields
+        class FormattedBookSchema(ModelSchema):
+            created = ma.fields.DateTime(format="%Y-%m-%d %H:%M")
+
+            class Meta:
+                model = Book
+
+        formatted_schema = FormattedBookSchema(only=("title", "created"))
+        loaded = formatted_schema.load_bson(formatted_schema.dump_bson(book))
+        assert loaded.created == datetime(2020, 1, 2, 3, 4)
+        with pytest.raises(ma.ValidationError) as excinfo:
+            schema.load_bson(encoded[:-2])
+        assert "_schema" in excinfo.value.normalized_messages()
+
     def test_check_bad_model(self):
         class DummyClass:
             pass
@@ -456,6 +1010,28 @@ class TestModelSchema(BaseTest):
                 class Meta:
                     model = DummyClass
 
+    def test_model_schema_default_skip_values(self):
+        class Doc(me.Document):
+            count = me.IntField()
+            flag = me.BooleanField()
+            name = me.StringField()
+            tags = me.ListField(me.StringField())
+            data = me.DictField()
+
+        class DocSchema(ModelSchema):
+            class Meta:
+                model = Doc
+
+        docs = [
+            Doc(count=0, flag=False, name="", tags=[], data={}),
+            Doc(tags=["a"], data={"a": []}),
+        ]
+        # Only None, empty lists and empty dicts are skipped
+        assert DocSchema().dump(docs, many=True) == [
+            {"count": 0, "flag": False, "name": ""},
+            {"tags": ["a"], "data": {"a": []}},
+        ]
+
     @exception_test
     def test_model_schema_custom_skip_values(self, models, schemas):
         student = models.Student(
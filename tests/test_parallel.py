@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import concurrent.futures
+
+import mongoengine as me
+import pytest
+
+from marshmallow_mongoengine import ModelSchema
+
+TEST_DB = "marshmallow_mongoengine-test"
+db = me.connect(TEST_DB)
+
+
+class BaseTest(object):
+    @classmethod
+    def setup_method(self, method):
+        # Reset database from previous test run
+        db.drop_database(TEST_DB)
+
+
+# Defined at the module level to be imported by the worker processes
+class ParallelAuthor(me.Document):
+    name = me.StringField()
+
+
+class ParallelBook(me.Document):
+    title = me.StringField(db_field="t")
+    author = me.ReferenceField(ParallelAuthor)
+    tags = me.ListField(me.StringField())
+
+
+class ParallelBookSchema(ModelSchema):
+    class Meta:
+        model = ParallelBook
+
+
+class TestParallelDump(BaseTest):
+    @pytest.fixture
+    def books(self):
+        author = ParallelAuthor(name="Jules").save()
+        for i in range(25):
+            ParallelBook(title="%02d" % i, author=author, tags=["t"] * (i % 3)).save()
+        return ParallelBook.objects.order_by("t")
+
+    def test_parallel_dump(self, books):
+        schema = ParallelBookSchema()
+        expected = schema.dump(books, many=True)
+        assert list(schema.parallel_dump(books, workers=2, batch_size=4)) == expected
+        chunks = list(
+            schema.parallel_dump(list(books), workers=2, batch_size=10, chunks=True)
+        )
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+        assert sum(chunks, []) == expected
+
+    def test_parallel_dump_options(self, books):
+        schema = ParallelBookSchema(only=("title", "tags"))
+        with concurrent.futures.ThreadPoolExecutor(3) as executor:
+            dumped = list(
+                schema.parallel_dump(
+                    books.as_pymongo(), executor=executor, batch_size=3
+                )
+            )
+        assert dumped == schema.dump(books, many=True)
+        assert set(dumped[0]) == {"title"}
+
+    def test_local_schema(self):
+        class LocalSchema(ModelSchema):
+            class Meta:
+                model = ParallelBook
+
+        with pytest.raises(ValueError):
+            list(LocalSchema().parallel_dump([], workers=1))
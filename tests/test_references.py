@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from unittest import mock
+
+from bson import DBRef
+import mongoengine as me
+import pytest
+from marshmallow.exceptions import ValidationError
+
+from marshmallow_mongoengine import IdentityMap, ModelSchema, fields
+
+TEST_DB = "marshmallow_mongoengine-test"
+db = me.connect(TEST_DB)
+
+
+class BaseTest(object):
+    @classmethod
+    def setup_method(self, method):
+        # Reset database from previous test run
+        db.drop_database(TEST_DB)
+
+
+@pytest.fixture()
+def models():
+    class Author(me.Document):
+        name = me.StringField()
+
+    class Tag(me.Document):
+        id = me.StringField(primary_key=True)
+
+    class Review(me.EmbeddedDocument):
+        reviewer = me.ReferenceField(Author)
+
+    class Book(me.Document):
+        title = me.StringField()
+        author = me.ReferenceField(Author)
+        tags = me.ListField(me.ReferenceField(Tag))
+        reviews = me.ListField(me.EmbeddedDocumentField(Review))
+
+    class _models(object):
+        def __init__(self):
+            self.Author = Author
+            self.Tag = Tag
+            self.Review = Review
+            self.Book = Book
+
+    return _models()
+
+
+@pytest.fixture()
+def no_single_get():
+    with mock.patch.object(
+        me.queryset.QuerySet, "get", side_effect=AssertionError("not batched")
+    ):
+        yield
+
+
+class TestBatchedReferences(BaseTest):
+    def test_load_many(self, models, no_single_get):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+
+        authors = [models.Author(name=name).save() for name in ("Jules", "Victor")]
+        tags = [models.Tag(id=id).save() for id in ("novel", "classic")]
+        payload = [
+            {
+                "title": "Book %s" % i,
+                "author": str(authors[i % 2].pk),
+                "tags": ["novel", "classic"],
+                "reviews": [{"reviewer": str(authors[(i + 1) % 2].pk)}],
+            }
+            for i in range(10)
+        ]
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "__iter__",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.__iter__,
+        ) as iter_mock:
+            books = BookSchema().load(payload, many=True)
+        # One query per referenced document class
+        assert iter_mock.call_count == 2
+        for i, book in enumerate(books):
+            assert book.author == authors[i % 2]
+            assert book.tags == tags
+            assert book.reviews[0].reviewer == authors[(i + 1) % 2]
+
+    def test_load_many_generator(self, models, no_single_get):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+
+        author = models.Author(name="Jules").save()
+        payload = [{"title": "Book %s" % i, "author": str(author.pk)} for i in range(3)]
+        books = BookSchema().load((item for item in payload), many=True)
+        assert [book.title for book in books] == ["Book 0", "Book 1", "Book 2"]
+        assert all(book.author == author for book in books)
+
+    def test_load_many_unknown_documents(self, models, no_single_get):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+
+        author = models.Author(name="Jules").save()
+        payload = [
+            {"author": str(author.pk)},
+            {"author": "5578726b7a58012298a5a7e2"},
+            {"tags": ["unknown"]},
+        ]
+        with pytest.raises(ValidationError) as excinfo:
+            BookSchema().load(payload, many=True)
+        assert excinfo.value.args[0] == {
+            1: {"author": ["unknown document Author `5578726b7a58012298a5a7e2`"]},
+            2: {"tags": {0: ["unknown document Tag `unknown`"]}},
+        }
+
+    def test_load_many_invalid_pk(self, models):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+
+        with pytest.raises(ValidationError) as excinfo:
+            BookSchema().load([{"author": "not an objectId"}], many=True)
+        assert excinfo.value.args[0] == {
+            0: {"author": ["unknown document Author `not an objectId`"]}
+        }
+
+    def test_disable_batch(self, models):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+                model_batch_references = False
+
+        author = models.Author(name="Jules").save()
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "get",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.get,
+        ) as get_mock:
+            books = BookSchema().load([{"author": str(author.pk)}] * 3, many=True)
+        assert get_mock.call_count == 3
+        assert all(book.author == author for book in books)
+
+    def test_referenced_fields(self, models):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+
+        class ReviewSchema(ModelSchema):
+            class Meta:
+                model = models.Review
+                exclude = ("reviewer",)
+
+        assert sorted(BookSchema().referenced_fields) == ["author", "reviews", "tags"]
+        schema = ReviewSchema()
+        assert schema.referenced_fields == {}
+        # No references to collect nor batch scope when loading
+        with mock.patch(
+            "marshmallow_mongoengine.references.collect_references"
+        ) as collect_mock, mock.patch(
+            "marshmallow_mongoengine.references.batch_scope"
+        ) as scope_mock:
+            schema.load([{}, {}], many=True)
+        assert not collect_mock.called
+        assert not scope_mock.called
+
+
+class TestIdentityMap(BaseTest):
+    def test_context_manager(self, models, no_single_get):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+
+        author = models.Author(name="Jules").save()
+        payload = [{"author": str(author.pk)}, {"author": str(author.pk)}]
+        with IdentityMap() as identity_map:
+            books = BookSchema().load(payload, many=True)
+            assert (identity_map.hits, identity_map.misses) == (0, 1)
+            books += BookSchema().load(payload, many=True)
+            assert (identity_map.hits, identity_map.misses) == (1, 1)
+        assert len(identity_map) == 1
+        assert all(book.author is books[0].author for book in books)
+
+    def test_schema_context(self, models):
+        class Doc(me.Document):
+            generic = me.GenericReferenceField()
+
+        class DocSchema(ModelSchema):
+            class Meta:
+                model = Doc
+                model_batch_references = False
+
+        author = models.Author(name="Jules").save()
+        identity_map = IdentityMap()
+        schema = DocSchema()
+        schema.context["identity_map"] = identity_map
+        payload = {"generic": {"id": str(author.pk), "_cls": "Author"}}
+        docs = [schema.load(payload) for _ in range(3)]
+        assert (identity_map.hits, identity_map.misses) == (2, 1)
+        assert all(doc.generic is docs[0].generic for doc in docs)
+
+    def test_maxsize(self, models):
+        identity_map = IdentityMap(maxsize=2)
+        authors = [models.Author(name=str(i)).save() for i in range(3)]
+        for author in authors:
+            identity_map.put(models.Author, author.pk, author)
+        assert len(identity_map) == 2
+        assert identity_map.get(models.Author, authors[0].pk) is None
+        assert identity_map.get(models.Author, authors[2].pk) is authors[2]
+        assert (identity_map.hits, identity_map.misses) == (1, 1)
+
+
+class TestDumpReferences(BaseTest):
+    def test_dump_without_dereferencing(self, models):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+
+        author = models.Author(name="Jules").save()
+        tags = [models.Tag(id=id).save() for id in ("novel", "classic")]
+        book = models.Book(
+            author=author, tags=tags, reviews=[models.Review(reviewer=author)]
+        ).save()
+        book = models.Book.objects.get(pk=book.pk)
+        # Referenced documents can be removed, only their pk is dumped
+        author.delete()
+        dump_data = BookSchema().dump(book)
+        assert dump_data == {
+            "id": str(book.pk),
+            "author": str(author.pk),
+            "tags": ["novel", "classic"],
+            "reviews": [{"reviewer": str(author.pk)}],
+        }
+        assert isinstance(book._data["author"], DBRef)
+        assert all(isinstance(tag, DBRef) for tag in book._data["tags"])
+
+    def test_dump_generic_without_dereferencing(self, models):
+        class Doc(me.Document):
+            generic = me.GenericReferenceField()
+            generics = me.ListField(me.GenericReferenceField())
+
+        class DocSchema(ModelSchema):
+            class Meta:
+                model = Doc
+
+        author = models.Author(name="Jules").save()
+        tag = models.Tag(id="novel").save()
+        doc = Doc(generic=author, generics=[author, tag]).save()
+        doc = Doc.objects.get(pk=doc.pk)
+        dump_data = DocSchema().dump(doc)
+        assert dump_data == {
+            "id": str(doc.pk),
+            "generic": str(author.pk),
+            "generics": [str(author.pk), "novel"],
+        }
+        assert isinstance(doc._data["generic"], dict)
+
+
+class TestBatchedGenericReferences(BaseTest):
+    def test_load_many(self, models, no_single_get):
+        class Activity(me.Document):
+            target = me.GenericReferenceField(choices=[models.Author, models.Tag])
+
+        class ActivitySchema(ModelSchema):
+            class Meta:
+                model = Activity
+
+        author = models.Author(name="Jules").save()
+        tag = models.Tag(id="novel").save()
+        book = models.Book(title="Around the World").save()
+        payload = [
+            {"target": {"id": str(author.pk), "_cls": "Author"}},
+            {"target": {"id": "novel", "_cls": "Tag"}},
+            {"target": {"id": "unknown", "_cls": "Tag"}},
+            {"target": {"id": str(book.pk), "_cls": "Book"}},
+        ]
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "__iter__",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.__iter__,
+        ) as iter_mock:
+            with pytest.raises(ValidationError) as excinfo:
+                ActivitySchema().load(payload, many=True)
+        # One query per allowed document class
+        assert iter_mock.call_count == 2
+        errors = excinfo.value.args[0]
+        assert sorted(errors) == [2, 3]
+        assert errors[2]["target"][0].startswith("unknown document Tag")
+        assert errors[3]["target"][0].startswith("Invalid _cls field `Book`")
+
+        activities = ActivitySchema().load(payload[:2] * 5, many=True)
+        assert [activity.target for activity in activities] == [author, tag] * 5
+
+
+class TestExistenceOnly(BaseTest):
+    def test_field_option(self, models, no_single_get):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+                model_fields_kwargs = {"author": {"existence_only": True}}
+
+        author = models.Author(name="Jules").save()
+        books = BookSchema().load(
+            [{"author": str(author.pk)}, {"author": str(author.pk)}], many=True
+        )
+        for book in books:
+            assert book._data["author"] == DBRef("author", author.pk)
+        books[0].save()
+        assert models.Book.objects(pk=books[0].pk).first().author == author
+        # Missing documents are still reported
+        with pytest.raises(ValidationError) as excinfo:
+            BookSchema().load({"author": "5578726b7a58012298a5a7e2"})
+        assert excinfo.value.args[0] == {
+            "author": ["unknown document Author `5578726b7a58012298a5a7e2`"]
+        }
+
+    def test_schema_option(self, models):
+        class Doc(me.Document):
+            ref = me.LazyReferenceField(models.Author)
+            generic = me.GenericReferenceField()
+            tags = me.ListField(me.ReferenceField(models.Tag))
+            reviews = me.ListField(me.EmbeddedDocumentField(models.Review))
+
+        class DocSchema(ModelSchema):
+            class Meta:
+                model = Doc
+                model_references_existence_only = True
+
+        author = models.Author(name="Jules").save()
+        models.Tag(id="novel").save()
+        doc = DocSchema().load(
+            {
+                "ref": str(author.pk),
+                "generic": {"id": str(author.pk), "_cls": "Author"},
+                "tags": ["novel"],
+                "reviews": [{"reviewer": str(author.pk)}],
+            }
+        )
+        assert isinstance(doc.ref, me.base.LazyReference)
+        assert doc.ref.pk == author.pk
+        assert doc._data["generic"]["_ref"] == DBRef("author", author.pk)
+        assert doc._data["tags"] == [DBRef("tag", "novel")]
+        # The option applies to the references of the embedded documents
+        reviewer = doc._data["reviews"][0]._data["reviewer"]
+        assert isinstance(reviewer, DBRef)
+        assert reviewer == DBRef("author", author.pk)
+        doc.save()
+        doc = Doc.objects.get(pk=doc.pk)
+        assert doc.ref.fetch() == author
+        assert doc.generic == author
+        assert doc.reviews[0].reviewer == author
+        with pytest.raises(ValidationError) as excinfo:
+            DocSchema().load({"tags": ["novel", "unknown"]})
+        assert excinfo.value.args[0] == {
+            "tags": {1: ["unknown document Tag `unknown`"]}
+        }
+        with pytest.raises(ValidationError) as excinfo:
+            DocSchema().load({"reviews": [{"reviewer": "5578726b7a58012298a5a7e2"}]})
+        assert excinfo.value.args[0] == {
+            "reviews": {
+                0: {"reviewer": ["unknown document Author `5578726b7a58012298a5a7e2`"]}
+            }
+        }
+
+
+class TestPopulate(BaseTest):
+    def test_populate(self, models, no_single_get):
+        class AuthorSchema(ModelSchema):
+            class Meta:
+                model = models.Author
+                fields = ("name",)
+
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+                model_fields_kwargs = {"author": {"populate": AuthorSchema}}
+                fields = ("title", "author", "reviews")
+
+        authors = [models.Author(name=name).save() for name in ("Jules", "Victor")]
+        for i in range(6):
+            models.Book(
+                title=str(i),
+                author=authors[i % 2],
+                reviews=[models.Review(reviewer=authors[(i + 1) % 2])],
+            ).save()
+        books = list(models.Book.objects.order_by("title"))
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "__iter__",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.__iter__,
+        ) as iter_mock:
+            dump_data = BookSchema().dump(books, many=True)
+        assert iter_mock.call_count == 1
+        assert dump_data == [
+            {
+                "title": str(i),
+                "author": {"name": authors[i % 2].name},
+                "reviews": [{"reviewer": str(authors[(i + 1) % 2].pk)}],
+            }
+            for i in range(6)
+        ]
+
+    def test_populate_nested_and_generic(self, models, no_single_get):
+        class Doc(me.Document):
+            generics = me.ListField(me.GenericReferenceField())
+            reviews = me.ListField(me.EmbeddedDocumentField(models.Review))
+
+        class ReviewSchema(ModelSchema):
+            reviewer = fields.Reference(models.Author, populate=True)
+
+            class Meta:
+                model = models.Review
+
+        class DocSchema(ModelSchema):
+            generics = fields.List(fields.GenericReference(populate=True))
+            reviews = fields.List(fields.Nested(ReviewSchema))
+
+            class Meta:
+                model = Doc
+                fields = ("generics", "reviews")
+
+        author = models.Author(name="Jules").save()
+        tag = models.Tag(id="novel").save()
+        doc = Doc(generics=[author, tag], reviews=[{"reviewer": author}]).save()
+        doc = Doc.objects(pk=doc.pk).first()
+        with mock.patch.object(
+            me.queryset.QuerySet,
+            "__iter__",
+            autospec=True,
+            side_effect=me.queryset.QuerySet.__iter__,
+        ) as iter_mock:
+            dump_data = DocSchema().dump(doc)
+        assert iter_mock.call_count == 2
+        assert dump_data == {
+            "generics": [{"id": str(author.pk), "name": "Jules"}, {"id": "novel"}],
+            "reviews": [{"reviewer": {"id": str(author.pk), "name": "Jules"}}],
+        }
+
+    def test_populate_removed_document(self, models):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+                model_fields_kwargs = {"author": {"populate": True}}
+                fields = ("title", "author")
+
+        authors = [models.Author(name=name).save() for name in ("Jules", "Victor")]
+        for i, author in enumerate(authors):
+            models.Book(title=str(i), author=author).save()
+        books = list(models.Book.objects.order_by("title"))
+        authors[1].delete()
+        # The pk of the removed documents is dumped, as without populate
+        assert BookSchema().dump(books, many=True) == [
+            {"title": "0", "author": {"id": str(authors[0].pk), "name": "Jules"}},
+            {"title": "1", "author": str(authors[1].pk)},
+        ]
+
+    def test_populate_generator(self, models):
+        class BookSchema(ModelSchema):
+            class Meta:
+                model = models.Book
+                model_fields_kwargs = {"author": {"populate": True}}
+                fields = ("title", "author")
+
+        author = models.Author(name="Jules").save()
+        for i in range(3):
+            models.Book(title=str(i), author=author).save()
+        books = models.Book.objects.order_by("title")
+        dump_data = BookSchema().dump((book for book in books), many=True)
+        assert dump_data == [
+            {"title": str(i), "author": {"id": str(author.pk), "name": "Jules"}}
+            for i in range(3)
+        ]